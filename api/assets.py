@@ -0,0 +1,51 @@
+"""Content-hashed static assets, loaded once per process and served with far-future caching."""
+import hashlib
+import mimetypes
+import os
+
+
+class StaticAssets:
+    """Maps ``report.css`` to ``report.<hash>.css`` so a deploy changes every asset URL.
+
+    Files are read into memory at import, which keeps serving them a dict lookup;
+    ``digest`` changes whenever any asset does and is folded into page ETags.
+    """
+
+    def __init__(self, directory):
+        self.files = {}
+        self.urls = {}
+        combined = hashlib.sha256()
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), 'rb') as f:
+                body = f.read()
+            digest = hashlib.sha256(body).hexdigest()[:12]
+            stem, ext = os.path.splitext(name)
+            hashed = f"{stem}.{digest}{ext}"
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            self.files[hashed] = (body, mimetype)
+            self.urls[name] = f"/static/{hashed}"
+            combined.update(digest.encode())
+        self.digest = combined.hexdigest()[:12]
+
+    def url(self, name):
+        return self.urls[name]
+
+    def lookup(self, hashed_name):
+        """Returns ``(body, mimetype)`` for a hashed file name, or None."""
+        return self.files.get(hashed_name)
+
+
+def templates_digest(directory, filters):
+    """Digest of every template source and the bytecode of the Jinja ``filters``.
+
+    Folded into page ETags next to ``StaticAssets.digest``, so a deploy that only
+    changes a template or a filter still invalidates cached pages.
+    """
+    combined = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as f:
+            combined.update(name.encode() + b'\0' + f.read())
+    for name, fn in sorted(filters.items()):
+        code = fn.__code__
+        combined.update(name.encode() + code.co_code + repr(code.co_consts).encode())
+    return combined.hexdigest()[:12]
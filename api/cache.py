@@ -0,0 +1,189 @@
+"""Redis-backed TTL cache with stale-while-revalidate and single-flight loading."""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import threading
+import time
+import uuid
+
+KEY_PREFIX = 'cache:'
+
+_refresh_inline = ContextVar('refresh_inline', default=False)
+
+
+class RedisCache:
+    """Caches loader results in Redis as ``{"v": value, "t": fetched_at}`` JSON entries.
+
+    An entry is fresh for ``ttl`` seconds and may then be served stale for another
+    ``stale_ttl`` seconds while a single background refresh runs. Misses are
+    de-duplicated across requests with a short Redis lock, so concurrent misses
+    trigger one upstream fetch and the other callers wait for its result.
+
+    Background refreshes are best effort: on serverless platforms such as
+    Vercel the instance may be frozen as soon as the response is sent, so the
+    thread only resumes on the next warm invocation and its lock blocks other
+    refreshes until ``lock_ttl`` runs out. Entries past their stale window, or
+    fetched before ``valid_after``, are therefore reloaded before returning,
+    and scheduled jobs should wrap their work in ``inline_refresh()``.
+
+    With ``metrics`` set, every lookup is counted in ``cache_requests_total``
+    by key family (the part before the first ``:``) and result.
+    """
+
+    def __init__(self, client, lock_ttl=15, wait_timeout=5.0, poll_interval=0.1, metrics=None):
+        self.client = client
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.metrics = metrics
+
+    def _count(self, key, result):
+        if self.metrics is not None:
+            self.metrics.inc('cache_requests_total', cache=key.split(':', 1)[0], result=result)
+
+    def _read(self, key):
+        try:
+            raw = self.client.get(KEY_PREFIX + key)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            print(f"读取缓存 {key} 失败: {e}")
+            return None
+
+    def _write(self, key, value, ttl, stale_ttl):
+        try:
+            entry = json.dumps({'v': value, 't': time.time()})
+            self.client.set(KEY_PREFIX + key, entry, ex=max(1, int(ttl + stale_ttl)))
+        except Exception as e:
+            print(f"写入缓存 {key} 失败: {e}")
+
+    def _acquire(self, key):
+        token = uuid.uuid4().hex
+        try:
+            if self.client.set(f"lock:{KEY_PREFIX}{key}", token, nx=True, ex=self.lock_ttl):
+                return token
+        except Exception as e:
+            print(f"获取缓存锁 {key} 失败: {e}")
+            return token  # Redis 不可用时退化为直接加载
+        return None
+
+    def _is_locked(self, key):
+        try:
+            return bool(self.client.exists(f"lock:{KEY_PREFIX}{key}"))
+        except Exception:
+            return False
+
+    def _release(self, key, token):
+        try:
+            lock_key = f"lock:{KEY_PREFIX}{key}"
+            if self.client.get(lock_key) == token:
+                self.client.delete(lock_key)
+        except Exception:
+            pass
+
+    def _load(self, key, loader, ttl, stale_ttl, should_cache, token):
+        try:
+            value = loader()
+            if should_cache(value):
+                self._write(key, value, ttl, stale_ttl)
+            return value
+        finally:
+            self._release(key, token)
+
+    def _refresh_in_background(self, key, loader, ttl, stale_ttl, should_cache):
+        token = self._acquire(key)
+        if token is None:
+            return  # 其他请求已在刷新
+
+        def run():
+            try:
+                self._load(key, loader, ttl, stale_ttl, should_cache, token)
+            except Exception as e:
+                print(f"后台刷新缓存 {key} 失败: {e}")
+        threading.Thread(target=run, daemon=True).start()
+
+    @contextmanager
+    def inline_refresh(self):
+        """Within the block (and tasks started from it), stale entries are reloaded before returning."""
+        token = _refresh_inline.set(True)
+        try:
+            yield
+        finally:
+            _refresh_inline.reset(token)
+
+    def merge(self, key, update, retries=3):
+        """Atomically applies ``update(value) -> value`` to an existing entry.
+
+        The entry keeps its original fetch time and expiry, so merged-in data never
+        makes older data look fresher. Does nothing if the key is absent.
+        """
+        if self.client is None:
+            return
+        from redis.exceptions import WatchError
+        redis_key = KEY_PREFIX + key
+        for _ in range(retries):
+            try:
+                with self.client.pipeline() as pipe:
+                    pipe.watch(redis_key)
+                    raw = pipe.get(redis_key)
+                    if not raw:
+                        return
+                    entry = json.loads(raw)
+                    entry['v'] = update(entry['v'])
+                    pipe.multi()
+                    pipe.set(redis_key, json.dumps(entry), keepttl=True)
+                    pipe.execute()
+                    return
+            except WatchError:
+                continue  # 并发写入，重试
+            except Exception as e:
+                print(f"合并缓存 {key} 失败: {e}")
+                return
+
+    def get_or_load(self, key, loader, ttl, stale_ttl=0, should_cache=bool, valid_after=None):
+        """Returns the cached value for ``key``, calling ``loader`` only when needed.
+
+        Values rejected by ``should_cache`` (by default, falsy ones) are returned
+        but not stored. Entries fetched before the ``valid_after`` timestamp are
+        reloaded before returning, as are entries past ``ttl + stale_ttl``; if
+        that reload fails or is rejected by ``should_cache`` the old value is returned. Loader exceptions propagate
+        on a cold miss.
+        """
+        if self.client is None:
+            return loader()
+
+        def usable_for(entry, seconds):
+            return (valid_after is None or entry['t'] >= valid_after) and time.time() - entry['t'] < seconds
+
+        entry = self._read(key)
+        if entry is not None:
+            if usable_for(entry, ttl):
+                self._count(key, 'hit')
+                return entry['v']
+            if usable_for(entry, ttl + stale_ttl) and not _refresh_inline.get():
+                self._count(key, 'stale')
+                self._refresh_in_background(key, loader, ttl, stale_ttl, should_cache)
+                return entry['v']
+
+        try:
+            token = self._acquire(key)
+            if token is not None:
+                self._count(key, 'miss')
+                value = self._load(key, loader, ttl, stale_ttl, should_cache, token)
+                return value if entry is None or should_cache(value) else entry['v']
+            self._count(key, 'wait')
+
+            # 其他请求正在加载同一个键：等待其结果，超时后自行加载
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                latest = self._read(key)
+                if latest is not None and usable_for(latest, ttl):
+                    return latest['v']
+                if not self._is_locked(key):
+                    break  # 加载方结束但未写入缓存（如上游失败）
+            return loader()
+        except Exception as e:
+            if entry is None:
+                raise
+            print(f"同步刷新缓存 {key} 失败，返回旧值: {e}")
+            return entry['v']
@@ -0,0 +1,40 @@
+"""Bounded thread-pool fan-out with a single overall deadline."""
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextvars
+import time
+
+PENDING_LOG_LIMIT = 5  # 超时日志最多列出的任务数
+
+
+def run_concurrently(jobs, timeout, max_workers=16, defaults=None):
+    """Runs every callable in ``jobs`` in parallel and waits at most ``timeout`` seconds.
+
+    Returns a dict keyed like ``jobs``. A job that raises or misses the deadline
+    yields ``defaults.get(key)`` instead, so callers always get partial results.
+    """
+    defaults = defaults or {}
+    results = {key: defaults.get(key) for key in jobs}
+    if not jobs:
+        return results
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(jobs)), thread_name_prefix='fetch')
+    started = time.monotonic()
+    # Each job runs in a copy of the caller's context, so request-scoped context variables carry over
+    futures = {executor.submit(contextvars.copy_context().run, fn): key for key, fn in jobs.items()}
+    try:
+        done, pending = wait(futures, timeout=timeout)
+        for future in done:
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                print(f"并发任务 {key} 出错: {e}")
+        if pending:
+            elapsed = time.monotonic() - started
+            keys = [futures[f] for f in pending]
+            shown = ', '.join(map(str, keys[:PENDING_LOG_LIMIT])) + (' ...' if len(keys) > PENDING_LOG_LIMIT else '')
+            print(f"{len(pending)} 个任务在 {elapsed:.1f}s 截止时间内未完成，使用部分结果: {shown}")
+    finally:
+        # Don't block on stragglers: un-started jobs are cancelled, running ones finish in the background.
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
@@ -0,0 +1,93 @@
+"""Historical NAV time series stored as packed float64 records in Redis sorted sets.
+
+Every record is a fixed-width little-endian run of doubles whose first field is
+the timestamp, stored as a sorted-set member scored by that timestamp. A range
+query concatenates the members and decodes them in one ``array('d', ...)`` call,
+so no per-record parsing happens in Python. Each append also upserts the record
+into daily, weekly and monthly rollup sets (last value per bucket wins), and raw
+records older than ``raw_retention_days`` are trimmed.
+"""
+from array import array
+from datetime import datetime, timedelta, timezone
+import struct
+import sys
+
+CST = timezone(timedelta(hours=8), 'CST')
+
+TOTAL_FIELDS = ('t', 'net_worth', 'total_assets_cny', 'total_pnl_cny', 'total_pnl_percent', 'liabilities')
+HOLDING_FIELDS = ('t', 'price', 'shares', 'market_value_cny', 'pnl_cny')
+RESOLUTIONS = ('raw', '1d', '1w', '1m')
+
+
+def bucket_start(ts, resolution):
+    """Start of the CST day/week (Monday)/month bucket containing ``ts``."""
+    day = datetime.fromtimestamp(ts, CST).replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == '1w':
+        day -= timedelta(days=day.weekday())
+    elif resolution == '1m':
+        day = day.replace(day=1)
+    return day.timestamp()
+
+
+def pack(fields, values):
+    return struct.pack(f'<{len(fields)}d', *(float(values.get(f, 0.0)) for f in fields))
+
+
+def unpack_columns(members, fields):
+    """Decodes concatenated records into ``{field: [values...]}`` columns in bulk."""
+    values = array('d', b''.join(members))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    width = len(fields)
+    return {field: values[i::width].tolist() for i, field in enumerate(fields)}
+
+
+class HistoryStore:
+    def __init__(self, client, prefix='history', raw_retention_days=30):
+        """``client`` must be a Redis connection with ``decode_responses=False``."""
+        self.client = client
+        self.prefix = prefix
+        self.raw_retention = raw_retention_days * 86400
+
+    def _key(self, series, resolution):
+        return f"{self.prefix}:{series}:{resolution}"
+
+    def _add(self, pipe, series, fields, values, ts):
+        record = pack(fields, {**values, 't': ts})
+        pipe.zadd(self._key(series, 'raw'), {record: ts})
+        pipe.zremrangebyscore(self._key(series, 'raw'), '-inf', f'({ts - self.raw_retention}')
+        for resolution in RESOLUTIONS[1:]:
+            key, start = self._key(series, resolution), bucket_start(ts, resolution)
+            # 每个周期只保留最后一条记录（收盘值）
+            pipe.zremrangebyscore(key, start, start)
+            pipe.zadd(key, {record: start})
+
+    def append(self, context, ts):
+        """Appends the totals and per-holding values of a report context at ``ts``."""
+        pipe = self.client.pipeline(transaction=True)
+        self._add(pipe, 'totals', TOTAL_FIELDS, context, ts)
+        for code, details in context['all_data'].items():
+            self._add(pipe, f'holding:{code}', HOLDING_FIELDS, details, ts)
+        pipe.execute()
+
+    def last_time(self):
+        """Timestamp of the newest totals record, or None if nothing was appended yet."""
+        latest = self.client.zrevrange(self._key('totals', 'raw'), 0, 0, withscores=True)
+        return latest[0][1] if latest else None
+
+    def query(self, start, end, resolution='1d', codes=()):
+        """Returns columnar totals and per-holding series for ``[start, end]`` in one round trip."""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unsupported resolution: {resolution}")
+        if resolution != 'raw':
+            start = bucket_start(start, resolution)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zrangebyscore(self._key('totals', resolution), start, end)
+        for code in codes:
+            pipe.zrangebyscore(self._key(f'holding:{code}', resolution), start, end)
+        totals, *holdings = pipe.execute()
+        return {
+            'resolution': resolution,
+            'totals': unpack_columns(totals, TOTAL_FIELDS),
+            'holdings': {code: unpack_columns(members, HOLDING_FIELDS) for code, members in zip(codes, holdings)},
+        }
@@ -1,26 +1,100 @@
-from flask import Flask, Response, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import os
+import sys
 from datetime import datetime, timezone, timedelta
-import requests
-from bs4 import BeautifulSoup
 import time
-import re
 import json
-import redis
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from concurrency import run_concurrently
+from cache import RedisCache
+from metrics import Metrics, start_request, server_timing
+from redis_client import LazyRedis
+from market_calendar import TradingCalendar, market_for_code
+from snapshot import SnapshotStore, SnapshotConflict, SNAPSHOT_SCHEMA
+from history import HistoryStore
+from upstream import UpstreamClient, HostPolicy
+from news_store import NewsStore
+from providers import (QUOTE_PROVIDERS, FX_PROVIDERS, NEWS_PROVIDERS, RecordingTransport,
+                       ReplayTransport)
+from stream import QuoteBroadcaster, diff, format_event, ROW_FIELDS, TOTAL_FIELDS
+from assets import StaticAssets, templates_digest
+import portfolio_config
+from portfolio_config import ConfigError, ConfigConflict, ConfigBusy
+from tenants import (DEFAULT_PORTFOLIO_ID, PortfolioRegistry, is_valid_portfolio_id, config_key,
+                     snapshot_key, history_prefix)
+import threading
+import queue
 
 # --- Vercel 环境修正 ---
 os.environ['HOME'] = '/tmp'
-app = Flask(__name__)
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+app = Flask(__name__, root_path=API_DIR, static_folder=None)
+
+# --- 模板与静态资源 ---
+# 模板在导入时编译一次；静态资源按内容哈希命名，可被浏览器/CDN 永久缓存
+assets = StaticAssets(os.path.join(API_DIR, 'static'))
+app.jinja_env.globals['asset_url'] = assets.url
+TEMPLATE_FILTERS = {
+    'money': lambda v: f"{v:,.2f}",
+    'thousands': lambda v: f"{v:,}",
+    'fixed': lambda v: f"{v:.2f}",
+}
+app.jinja_env.filters.update(TEMPLATE_FILTERS)
+# 模板或过滤器变化时页面 ETag 随之变化
+TEMPLATES_DIGEST = templates_digest(os.path.join(API_DIR, 'templates'), TEMPLATE_FILTERS)
+REPORT_TEMPLATE = app.jinja_env.get_template('report.html')
+MAIN_CONTENT_TEMPLATE = app.jinja_env.get_template('main_content.html')
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
 
 # --- Redis Client Initialization ---
-try:
-    redis_url = os.environ.get('KV_REDIS_URL')
-    if not redis_url:
-        raise ValueError("KV_REDIS_URL environment variable not found.")
-    r = redis.Redis.from_url(redis_url, decode_responses=True) # decode_responses=True is important
-except Exception as e:
-    print(f"Error initializing Redis: {e}")
-    r = None
+# 客户端在首次执行命令时才创建，冷启动时不导入 redis、不建立连接池
+redis_url = os.environ.get('KV_REDIS_URL')
+if redis_url:
+    r = LazyRedis(redis_url, decode_responses=True) # decode_responses=True is important
+    r_raw = LazyRedis(redis_url) # binary client for packed history records
+else:
+    print("Error initializing Redis: KV_REDIS_URL environment variable not found.")
+    r = r_raw = None
+
+# --- 监控指标 ---
+# 计数与耗时直方图累计在 Redis 中，跨函数实例保留；/api/metrics 以 Prometheus 文本格式导出
+# 每 METRICS_FLUSH_EVERY 个请求或 METRICS_FLUSH_SECONDS 秒批量写入一次
+metrics = Metrics(r, flush_every=int(os.environ.get('METRICS_FLUSH_EVERY', 20)),
+                  flush_interval=float(os.environ.get('METRICS_FLUSH_SECONDS', 60)))
+
+# --- 上游数据缓存 (秒) ---
+# 交易时段内行情几秒即过期；休市后收盘快照直到下次开盘前都有效
+QUOTE_TTL_TRADING, QUOTE_STALE_TTL = 15, 300
+# 收盘后几分钟内新浪仍可能返回集合竞价前的价格，宽限期过后抓取的行情才视为收盘价
+QUOTE_SETTLE_GRACE_SECONDS = 5 * 60
+NEWS_TTL, NEWS_STALE_TTL = 30 * 60, 24 * 3600
+NEWS_DISPLAY_LIMIT = 5
+# 只为权重最大的若干持仓抓取并展示新闻，避免大组合按持仓数放大抓取量
+NEWS_REFRESH_LIMIT = int(os.environ.get('NEWS_REFRESH_LIMIT', 20))
+FX_TTL, FX_STALE_TTL = 24 * 3600, 7 * 24 * 3600
+cache = RedisCache(r, metrics=metrics)
+
+# --- 报告快照 ---
+# 定时任务预先生成报告并写入 Redis，页面访问只需读取一次快照
+SNAPSHOT_MAX_AGE = NEWS_TTL
+CRON_SECRET = os.environ.get('CRON_SECRET')
+news_store = NewsStore(r) if r else None
+# 每个组合最多向共享行情批次贡献 UNIVERSE_PER_PORTFOLIO 个代码，其余由该组合自行补抓
+registry = PortfolioRegistry(r, per_portfolio_limit=int(os.environ.get('UNIVERSE_PER_PORTFOLIO', 500))) if r else None
+
+# --- 实时推送 (SSE) ---
+# 单连接最长时长需小于函数超时；浏览器会按 retry 间隔自动重连
+STREAM_TICK_SECONDS = 5
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_MAX_SECONDS = int(os.environ.get('STREAM_MAX_SECONDS', 55))
+
+def snapshot_store(portfolio_id):
+    return SnapshotStore(r, key=snapshot_key(portfolio_id), config_key=config_key(portfolio_id))
+
+def history_store(portfolio_id):
+    return HistoryStore(r_raw, prefix=history_prefix(portfolio_id))
 
 # --- 默认配置 ---
 DEFAULT_PORTFOLIO = {
@@ -29,399 +103,706 @@ DEFAULT_PORTFOLIO = {
     '00981.HK':  {'shares': 6000,  'name': '中芯国际'}
 }
 DEFAULT_LIABILITIES_CNY = 2527439
-
-session = requests.Session()
-session.headers.update({'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'})
+DEFAULT_HKD_CNY_RATE = 0.9
+
+# --- 并发抓取配置 ---
+# 所有上游请求共享一个总截止时间，需小于 Vercel 函数超时
+FETCH_DEADLINE_SECONDS = float(os.environ.get('FETCH_DEADLINE_SECONDS', 8))
+FETCH_MAX_WORKERS = int(os.environ.get('FETCH_MAX_WORKERS', 16))
+
+# --- 上游请求客户端 ---
+# 每个数据源独立的连接池、并发上限、重试与熔断策略
+upstream = UpstreamClient(
+    metrics=metrics,
+    headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'},
+    policies={
+        'hq.sinajs.cn': HostPolicy(pool_size=4, max_concurrency=4, timeout=(3, 5)),
+        'vip.stock.finance.sina.com.cn': HostPolicy(pool_size=8, max_concurrency=8, timeout=(3, 8)),
+        'www.google.com': HostPolicy(pool_size=2, max_concurrency=2, timeout=(3, 5), retries=1),
+    },
+)
+
+# --- 行情数据源 ---
+# 报价、汇率与新闻各自可替换；设置 PROVIDER_REPLAY_DIR 时从磁盘回放录制的响应（离线压测/回归），
+# 设置 PROVIDER_RECORD_DIR 时把真实响应录制下来
+PROVIDER_REPLAY_DIR = os.environ.get('PROVIDER_REPLAY_DIR')
+PROVIDER_RECORD_DIR = os.environ.get('PROVIDER_RECORD_DIR')
+PROVIDER_REPLAY_LATENCY_MS = float(os.environ.get('PROVIDER_REPLAY_LATENCY_MS', 0))
+if PROVIDER_REPLAY_DIR:
+    transport = ReplayTransport(PROVIDER_REPLAY_DIR, latency=PROVIDER_REPLAY_LATENCY_MS / 1000)
+elif PROVIDER_RECORD_DIR:
+    transport = RecordingTransport(upstream, PROVIDER_RECORD_DIR)
+else:
+    transport = upstream
+quote_provider = QUOTE_PROVIDERS[os.environ.get('QUOTE_PROVIDER', 'sina')](transport)
+fx_provider = FX_PROVIDERS[os.environ.get('FX_PROVIDER', 'google')](transport)
+news_provider = NEWS_PROVIDERS[os.environ.get('NEWS_PROVIDER', 'sina')](transport)
 
 # --- Timezone Setup ---
 CST = timezone(timedelta(hours=8), 'CST')
+CALENDAR = TradingCalendar.load()
 
-# --- 数据获���模块 ---
-def get_market_data(portfolio):
-    a_codes = [c for c in portfolio if c.endswith(('.SH', '.SZ'))]
-    hk_codes = [c for c in portfolio if c.endswith('.HK')]
-    
-    def fetch_sina_data(codes, is_hk=False):
-        data = {}
-        if not codes: return data
-        
-        prefix = "hk" if is_hk else ""
-        sina_codes = [f"{prefix}{c.split('.')[0]}" if is_hk else f"{c[-2:].lower()}{c[:-3]}" for c in codes]
-        url = f"http://hq.sinajs.cn/list={','.join(sina_codes)}"
-        
-        try:
-            headers = {'Referer': 'https://finance.sina.com.cn/'}
-            response = session.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            content = response.text
-            
-            # Get current time in Beijing for comparison
-            now_cst = datetime.now(CST)
-            today_930_cst = now_cst.replace(hour=9, minute=30, second=0, microsecond=0)
-
-            for i, code in enumerate(codes):
-                match = re.search(f'var hq_str_{sina_codes[i]}="(.*?)"', content)
-                if not match: continue
-                parts = match.group(1).split(',')
-                
-                if is_hk:
-                    price_idx, pre_close_idx, date_idx, time_idx = 6, 3, 17, 18
-                    date_format = '%Y/%m/%d'
-                else:
-                    price_idx, pre_close_idx, date_idx, time_idx = 3, 2, 30, 31
-                    date_format = '%Y-%m-%d'
-
-                if len(parts) <= max(price_idx, pre_close_idx, date_idx, time_idx): continue
-                
-                try:
-                    current_price = float(parts[price_idx])
-                    pre_close = float(parts[pre_close_idx])
-                    
-                    # Check market time
-                    market_date_str = parts[date_idx]
-                    market_time_str = parts[time_idx]
-                    market_dt_str = f"{market_date_str} {market_time_str}"
-                    
-                    # Handle HK market time which may not include seconds
-                    time_format = f"{date_format} %H:%M:%S"
-                    if is_hk and len(market_time_str.split(':')) == 2:
-                        time_format = f"{date_format} %H:%M"
-
-                    market_dt = datetime.strptime(market_dt_str, time_format).replace(tzinfo=CST)
-
-                    # If market time is before 9:30 AM today, treat current price as previous close to zero out P/L
-                    if market_dt < today_930_cst:
-                        current_price = pre_close
-                        print(f"  - {code}: 行情时间 ({market_time_str}) 早于 09:30，盈亏计为0。")
-
-                    if current_price != 0.0 and pre_close != 0.0:
-                        data[code] = {'price': current_price, 'pre_close': pre_close}
-                except (ValueError, IndexError) as e:
-                    print(f"  - 解析 {code} 数据时出错: {e}")
-        except Exception as e:
-            print(f"获取 {'港股' if is_hk else 'A股'} 数据时出错: {e}")
+# --- 数据获取模块 ---
+def fetch_quotes(codes, is_hk=False):
+    """Quotes from the configured provider, with P/L zeroed for quotes from before today's open."""
+    data = {}
+    if not codes: return data
+    try:
+        quotes = quote_provider.fetch_quotes(codes)
+    except Exception as e:
+        print(f"获取 {'港股' if is_hk else 'A股'} 数据时出错: {e}")
         return data
 
-    market_data = fetch_sina_data(a_codes)
-    market_data.update(fetch_sina_data(hk_codes, is_hk=True))
-    return market_data
+    # Get current time in Beijing for comparison
+    today_cst = datetime.now(CST).date()
+    first_quotes = {}
+    for code, quote in quotes.items():
+        current_price, pre_close = quote['price'], quote['pre_close']
+        # If the quote predates today's opening auction (or today is not a trading day),
+        # treat current price as previous close to zero out P/L
+        market = market_for_code(code)
+        if market not in first_quotes:
+            first_quotes[market] = CALENDAR.first_quote_time(market, today_cst)
+        first_quote = first_quotes[market]
+        if first_quote is None or quote['quoted_at'] < first_quote:
+            current_price = pre_close
+            print(f"  - {code}: 行情时间 ({quote['quoted_at']:%H:%M:%S}) 早于今日开盘，盈亏计为0。")
+        if current_price != 0.0 and pre_close != 0.0:
+            data[code] = {'price': current_price, 'pre_close': pre_close}
+    return data
+
+def quote_cache_policy(codes):
+    """Returns cache kwargs for a quote batch based on whether its markets are trading.
+
+    While closed, a snapshot fetched more than ``QUOTE_SETTLE_GRACE_SECONDS`` after
+    the last session end is final until the next open, so it is served from cache
+    with zero upstream calls. Within the grace period quotes expire as if trading.
+    """
+    now = datetime.now(CST)
+    is_open, settled_at, next_open = CALENDAR.quote_window({market_for_code(c) for c in codes}, now)
+    if is_open or settled_at is None or next_open is None:
+        return {'ttl': QUOTE_TTL_TRADING, 'stale_ttl': QUOTE_STALE_TTL}
+    valid_after = settled_at + timedelta(seconds=QUOTE_SETTLE_GRACE_SECONDS)
+    if now < valid_after:
+        return {'ttl': QUOTE_TTL_TRADING, 'stale_ttl': QUOTE_STALE_TTL}
+    return {'ttl': (next_open - valid_after).total_seconds(), 'stale_ttl': QUOTE_STALE_TTL,
+            'valid_after': valid_after.timestamp()}
+
+def fetch_quote_universe(codes, is_hk=False):
+    """Fetches ``codes`` plus every holding of every portfolio in the same market in one batch."""
+    a_universe, hk_universe = split_codes(registry.symbol_universe() if registry else ())
+    universe = sorted(set(codes) | set(hk_universe if is_hk else a_universe))
+    return {'codes': universe, 'quotes': fetch_quotes(universe, is_hk)}
+
+def get_quotes(codes, is_hk=False):
+    """Reads quotes from the per-market board shared by all portfolios.
+
+    The board is refreshed once per cycle for the union of all portfolios' symbols;
+    symbols no board batch has covered yet are fetched on their own and merged in.
+    """
+    if not codes: return {}
+    market = 'hk' if is_hk else 'a'
+    key = f"quotes:{market}"
+    with metrics.timed(f"quotes_{market}"):
+        board = cache.get_or_load(key, partial(fetch_quote_universe, codes, is_hk),
+                                  should_cache=lambda board: bool(board['quotes']), **quote_cache_policy(codes))
+        quotes = dict(board['quotes'])
+        missing = sorted(set(codes) - set(board['codes']))
+        if missing:
+            fetched = fetch_quotes(missing, is_hk)
+            cache.merge(key, lambda board: {'codes': sorted(set(board['codes']) | set(missing)),
+                                            'quotes': {**board['quotes'], **fetched}})
+            quotes.update(fetched)
+    return {c: quotes[c] for c in codes if c in quotes}
+
+def split_codes(portfolio):
+    a_codes = [c for c in portfolio if c.endswith(('.SH', '.SZ'))]
+    hk_codes = [c for c in portfolio if c.endswith('.HK')]
+    return a_codes, hk_codes
 
+@metrics.timed('fx')
 def get_hkd_cny_rate():
     try:
-        response = session.get("https://www.google.com/finance/quote/HKD-CNY", timeout=10)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        return float(soup.find('div', class_='YMlKec fxKbKc').text)
-    except Exception: return 0.9
-
-def get_news_from_sina(portfolio):
-    all_news = {}
-    print("正在从新浪财经抓取公司要闻...")
-    for code, details in portfolio.items():
-        if not isinstance(details, dict): continue
-        stock_name = details.get('name', '未知股票')
-        sina_code = f"{code[-2:].lower()}{code[:-3]}"
-        url = f"https://vip.stock.finance.sina.com.cn/corp/go.php/vCB_AllNewsStock/symbol/{sina_code}.phtml"
-        news_list = []
-        try:
-            response = session.get(url, timeout=15)
-            response.encoding = 'gbk'
-            soup = BeautifulSoup(response.text, 'html.parser')
-            news_container = soup.find('div', class_='datelist')
-            if news_container:
-                for item in news_container.find_all('a', limit=5):
-                    title = item.text.strip()
-                    link = item['href']
-                    date_match = re.search(r'(\d{4}-\d{2}-\d{2})', item.parent.text)
-                    date_str = date_match.group(1) if date_match else ""
-                    news_list.append({'title': title, 'url': link, 'source_time': date_str})
-        except Exception as e:
-            print(f"抓取 {stock_name} 新闻时出错: {e}")
-        all_news[code] = news_list
-    return all_news
+        return cache.get_or_load('fx:HKD-CNY', partial(fx_provider.fetch_rate, 'HKD', 'CNY'),
+                                 ttl=FX_TTL, stale_ttl=FX_STALE_TTL)
+    except Exception as e:
+        print(f"获取港币汇率时出错，使用默认值 {DEFAULT_HKD_CNY_RATE}: {e}")
+        return DEFAULT_HKD_CNY_RATE
+
+def refresh_stock_news(code):
+    """Incrementally ingests new articles for ``code``; returns how many were added."""
+    state = news_store.state(code)
+    result = news_provider.fetch_news(code, state)
+    if result is None:
+        news_store.touch(code)
+        return 0
+    items, validators = result
+    return news_store.ingest(code, items, state['known'], validators)
+
+@metrics.timed('news')
+def fetch_stock_news(code, details):
+    try:
+        cache.get_or_load(f"news-refresh:{code}", partial(refresh_stock_news, code), ttl=NEWS_TTL,
+                          stale_ttl=NEWS_STALE_TTL, should_cache=lambda added: True)
+    except Exception as e:
+        print(f"抓取 {details.get('name', '未知股票')} 新闻时出错: {e}")
+
+def news_codes(portfolio, weights=None, limit=NEWS_REFRESH_LIMIT):
+    """The ``limit`` holdings whose news is refreshed and shown, largest ``weights`` first.
+
+    ``weights`` usually comes from the last report; holdings without one keep
+    their portfolio order after the weighted ones.
+    """
+    codes = [code for code, details in portfolio.items() if isinstance(details, dict)]
+    if weights:
+        codes.sort(key=lambda code: -weights.get(code, 0.0))
+    return codes[:limit]
+
+def news_jobs(portfolio):
+    return {('news', code): partial(fetch_stock_news, code, details)
+            for code, details in portfolio.items() if isinstance(details, dict)}
+
+@metrics.timed('news_read')
+def read_news(codes, limit=NEWS_DISPLAY_LIMIT):
+    try:
+        return news_store.latest(codes, limit)
+    except Exception as e:
+        print(f"读取新闻失败: {e}")
+        return {code: [] for code in codes}
+
+def fetch_report_data(portfolio, weights=None):
+    """Fetches quotes, news and the FX rate in parallel under one deadline.
+
+    Sources that fail or time out fall back to empty data (or the default rate),
+    so total latency tracks the slowest call instead of the sum of all calls.
+    News covers only ``news_codes(portfolio, weights)``.
+    """
+    a_codes, hk_codes = split_codes(portfolio)
+    jobs = {
+        'A': partial(get_quotes, a_codes),
+        'HK': partial(get_quotes, hk_codes, is_hk=True),
+        'fx': get_hkd_cny_rate,
+        **news_jobs({code: portfolio[code] for code in news_codes(portfolio, weights)}),
+    }
+    print("正在并行抓取行情、汇率与公司要闻...")
+    results = run_concurrently(jobs, timeout=FETCH_DEADLINE_SECONDS, max_workers=FETCH_MAX_WORKERS,
+                               defaults={'fx': DEFAULT_HKD_CNY_RATE})
+    market_data = {**(results.pop('A') or {}), **(results.pop('HK') or {})}
+    hkd_cny_rate = results.pop('fx')
+    # News refresh jobs only ingest; the section always reads from the store
+    news_data = read_news([code for _, code in results])
+    return market_data, news_data, hkd_cny_rate
+
+def fetch_edit_data(portfolio, previous):
+    """Like ``fetch_report_data`` after an edit: reuses the previous report's prices and FX rate.
+
+    Only symbols the previous report had no price for are quoted, and only their
+    news is refreshed (within ``news_codes``); the other shown holdings' news is
+    read from the store.
+    """
+    reused = {code: {'price': row['price'], 'pre_close': row['pre_close']}
+              for code, row in previous['all_data'].items() if code in portfolio}
+    added = {code: details for code, details in portfolio.items() if code not in reused}
+    shown = news_codes(portfolio, {code: row['weight'] for code, row in previous['all_data'].items()})
+    a_codes, hk_codes = split_codes(added)
+    jobs = {'A': partial(get_quotes, a_codes), 'HK': partial(get_quotes, hk_codes, is_hk=True),
+            **news_jobs({code: added[code] for code in shown if code in added})}
+    hkd_cny_rate = previous.get('hkd_cny_rate')
+    if hkd_cny_rate is None:
+        jobs['fx'] = get_hkd_cny_rate
+    if added:
+        print(f"仅抓取新增持仓: {sorted(added)}")
+    results = run_concurrently(jobs, timeout=FETCH_DEADLINE_SECONDS, max_workers=FETCH_MAX_WORKERS,
+                               defaults={'fx': DEFAULT_HKD_CNY_RATE})
+    market_data = {**reused, **(results.pop('A') or {}), **(results.pop('HK') or {})}
+    hkd_cny_rate = results.pop('fx', hkd_cny_rate)
+    return market_data, read_news(shown), hkd_cny_rate
+
+def poll_market(codes):
+    """Quotes and FX only (no news), for the live stream's shared poll."""
+    a_codes, hk_codes = split_codes(codes)
+    results = run_concurrently({
+        'A': partial(get_quotes, a_codes),
+        'HK': partial(get_quotes, hk_codes, is_hk=True),
+        'fx': get_hkd_cny_rate,
+    }, timeout=FETCH_DEADLINE_SECONDS, max_workers=FETCH_MAX_WORKERS, defaults={'fx': DEFAULT_HKD_CNY_RATE})
+    return {'market_data': {**(results['A'] or {}), **(results['HK'] or {})}, 'hkd_cny_rate': results['fx']}
+
+broadcaster = QuoteBroadcaster(poll_market, interval=STREAM_TICK_SECONDS)
 
 # --- 核心逻辑与渲染 ---
-def get_report_context(portfolio, liabilities):
-    """Fetches all data and performs calculations."""
-    market_data = get_market_data(portfolio)
-    news_data = get_news_from_sina(portfolio)
-    hkd_cny_rate = get_hkd_cny_rate()
+def get_report_context(portfolio, liabilities, previous=None, weights=None):
+    """Fetches all data and performs calculations.
+
+    With ``previous`` (a still-fresh report context), data it already covers is reused.
+    ``weights`` (from the last report) picks which holdings' news to refresh.
+    """
+    from valuation import value_portfolio, rows, exposures  # numpy 仅在计算路径上导入
+    with metrics.timed('fetch'):
+        if previous is not None:
+            market_data, news_data, hkd_cny_rate = fetch_edit_data(portfolio, previous)
+        else:
+            market_data, news_data, hkd_cny_rate = fetch_report_data(portfolio, weights)
     
-    all_data = {}
-    total_assets_cny = total_pnl_cny = total_pre_close_value_cny = 0
-
-    for code, details in portfolio.items():
-        if not isinstance(details, dict) or code not in market_data: continue
-        
-        price_data = market_data[code]
-        is_hk = code.endswith('.HK')
-        rate = hkd_cny_rate if is_hk else 1.0
-        
-        market_value = price_data['price'] * details['shares'] * rate
-        pre_close_value = price_data['pre_close'] * details['shares'] * rate
-        pnl = market_value - pre_close_value
-        
-        all_data[code] = {
-            **price_data, 'name': details['name'], 'shares': details['shares'],
-            'currency': 'HKD' if is_hk else 'CNY', 'market_value_cny': market_value,
-            'pnl_cny': pnl, 'pnl_percent': (pnl / pre_close_value) * 100 if pre_close_value else 0
+    with metrics.timed('valuation'):
+        valuation = value_portfolio(portfolio, market_data, {'CNY': 1.0, 'HKD': hkd_cny_rate})
+        net_worth = valuation['total_assets_cny'] - liabilities
+        return {
+            "portfolio": portfolio, "liabilities": liabilities, "all_data": rows(portfolio, valuation),
+            "news_data": news_data, "net_worth": net_worth, "total_assets_cny": valuation['total_assets_cny'],
+            "total_pnl_cny": valuation['total_pnl_cny'], "total_pnl_percent": valuation['total_pnl_percent'],
+            "exposures": exposures(portfolio, valuation), "hkd_cny_rate": hkd_cny_rate,
         }
-        total_assets_cny += market_value
-        total_pnl_cny += pnl
-        total_pre_close_value_cny += pre_close_value
 
-    net_worth = total_assets_cny - liabilities
-    total_pnl_percent = (total_pnl_cny / total_pre_close_value_cny) * 100 if total_pre_close_value_cny else 0
-    
-    return {
-        "portfolio": portfolio, "liabilities": liabilities, "all_data": all_data,
-        "news_data": news_data, "net_worth": net_worth, "total_assets_cny": total_assets_cny,
-        "total_pnl_cny": total_pnl_cny, "total_pnl_percent": total_pnl_percent
-    }
+MARKET_LABELS = {'SSE': '沪市', 'SZSE': '深市', 'HKEX': '港股'}
+
+def exposure_lines(exposures):
+    lines = []
+    for title, key, labels in (('市场', 'market', MARKET_LABELS), ('币种', 'currency', {})):
+        items = sorted(exposures.get(key, {}).items(), key=lambda kv: -kv[1]['weight'])
+        if items:
+            lines.append((title, [f"{labels.get(label, label)} {item['weight'] * 100:.1f}%" for label, item in items]))
+    return lines
 
+@metrics.timed('render_main')
 def render_main_content_html(context):
     """Renders only the dynamic parts of the report (summary and table)."""
-    pnl_arrow = '▲' if context['total_pnl_cny'] >= 0 else '▼'
-    pnl_class_total = 'pnl-positive' if context['total_pnl_cny'] >= 0 else 'pnl-negative'
-    
-    portfolio_rows_html = []
-    for code, details in context['all_data'].items():
-        pnl_class = 'pnl-positive' if details['pnl_cny'] >= 0 else 'pnl-negative'
-        pnl_arrow_stock = '▲' if details['pnl_cny'] >= 0 else '▼'
-        portfolio_rows_html.append(f"""
-        <tr>
-            <td><strong>{details['name']}</strong></td><td>{code}</td>
-            <td><span class="sensitive-data" data-value="{details['shares']:,}">***</span></td>
-            <td>{details['price']:.2f} {details['currency']}</td>
-            <td><span class="sensitive-data" data-value="{details['market_value_cny']:,.2f}">***</span></td>
-            <td class="{pnl_class}">{pnl_arrow_stock} {abs(details['pnl_cny']):,.2f}</td>
-            <td class="{pnl_class}">{pnl_arrow_stock} {abs(details['pnl_percent']):.2f}%</td>
-        </tr>""")
-
-    news_html = ""
-    for code, news_list in context.get('news_data', {}).items():
-        if news_list:
-            stock_name = context['all_data'].get(code, {}).get('name', code)
-            news_html += f"<h3>{stock_name}</h3><ul>"
-            for item in news_list:
-                news_html += f"<li><a href='{item['url']}' target='_blank'>{item['title']}</a><span class='news-date'>{item.get('source_time', '')}</span></li>"
-            news_html += "</ul>"
-    
-    return f"""
-    <div class="card summary">
-        <div class="summary-item"><h3>总资产 (CNY)</h3><p><span class="sensitive-data" data-value="{context['total_assets_cny']:,.2f}">***</span></p></div>
-        <div class="summary-item"><h3>净资产 (CNY)</h3><p><span class="sensitive-data" data-value="{context['net_worth']:,.2f}">***</span></p></div>
-        <div class="summary-item"><h3>今日盈亏 (CNY)</h3><p class="{pnl_class_total}">{pnl_arrow} {abs(context['total_pnl_cny']):,.2f}</p><p class="pnl-details {pnl_class_total}">({pnl_arrow} {abs(context['total_pnl_percent']):.2f}%)</p></div>
-    </div>
-    <div class="card"><h2>持仓详情</h2><table><thead><tr><th>股票名称</th><th>代码</th><th>持股</th><th>当前价</th><th>市值 (CNY)</th><th>今日盈亏 (CNY)</th><th>涨跌幅</th></tr></thead><tbody>{''.join(portfolio_rows_html)}</tbody></table></div>
-    <div class="card news-section"><h2>相关要闻</h2>{news_html if news_html else "<p>暂无相关新闻。</p>"}</div>
-    """
+    return MAIN_CONTENT_TEMPLATE.render({'news_data': {}, **context,
+                                         'exposure_lines': exposure_lines(context.get('exposures', {}))})
 
-def render_full_page_html(context):
+@metrics.timed('render_page')
+def render_full_page_html(context, main_content_html=None, generated_at=None, portfolio_id=DEFAULT_PORTFOLIO_ID):
     """Renders the complete HTML page, including the main content."""
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    main_content_html = render_main_content_html(context)
-    # Safely escape quotes for the data attribute
-    portfolio_json_str = json.dumps(context['portfolio']).replace("'", "&apos;").replace('"', "&quot;")
-
-    return f"""
-    <!DOCTYPE html><html lang="zh-CN"><head>
-        <meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>个人资产报告</title>
-        <style>
-            body {{ font-family: 'Noto Sans SC', sans-serif; margin: 0; background-color: #f4f7f9; color: #333; }}
-            .container {{ max-width: 900px; margin: 30px auto; padding: 0 20px; }} .card {{ background-color: #fff; border-radius: 12px; box-shadow: 0 6px 20px rgba(0,0,0,0.07); padding: 25px; margin-bottom: 25px; }}
-            .header {{ display: flex; justify-content: center; align-items: center; }} h1 {{ font-size: 28px; margin: 0; }}
-            .controls {{ margin-left: 15px; display: flex; align-items: center; gap: 10px; }}
-            .control-btn {{ cursor: pointer; color: #555; background: #f0f0f0; border-radius: 50%; width: 36px; height: 36px; display: flex; justify-content: center; align-items: center; transition: background-color 0.2s; }}
-            .control-btn:hover {{ background-color: #e0e0e0; }}
-            .report-time {{ text-align: center; color: #888; margin: 10px 0 25px; }}
-            .summary {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(220px, 1fr)); gap: 20px; }}
-            .summary-item {{ background-color: #f8f9fa; text-align: center; padding: 20px; border-radius: 10px; }}
-            .summary-item h3 {{ margin: 0 0 10px 0; font-size: 16px; color: #555; }} .summary-item p {{ margin: 0; font-size: 26px; font-weight: 700; }}
-            .pnl-details {{ font-size: 18px; font-weight: normal; margin-top: 5px; }} .pnl-positive {{ color: #d04a4a; }} .pnl-negative {{ color: #47a27c; }}
-            table {{ width: 100%; border-collapse: collapse; margin-top: 15px; }} th, td {{ padding: 14px; text-align: left; border-bottom: 1px solid #f0f0f0; }}
-            .news-section h3 {{ margin-top: 20px; }} .news-section ul {{ list-style: none; padding-left: 0; }} .news-section li {{ padding: 10px 0; border-bottom: 1px solid #f0f0f0; }}
-            .news-section a {{ text-decoration: none; color: #0056b3; }} .news-date {{ float: right; color: #999; font-size: 14px; }}
-            
-            /* Modal Styles */
-            .modal {{ position: fixed; z-index: 100; left: 0; top: 0; width: 100%; height: 100%; background-color: rgba(0,0,0,0.5); display: none; justify-content: center; align-items: center; }}
-            .modal-content {{ background-color: #fefefe; padding: 20px 30px; border-radius: 10px; width: 90%; max-width: 600px; box-shadow: 0 5px 15px rgba(0,0,0,0.3); }}
-            .modal-header {{ display: flex; justify-content: space-between; align-items: center; border-bottom: 1px solid #e5e5e5; padding-bottom: 15px; margin-bottom: 20px; }}
-            .modal-header h2 {{ margin: 0; font-size: 22px; }}
-            .close-btn {{ color: #aaa; font-size: 28px; font-weight: bold; cursor: pointer; }} .close-btn:hover {{ color: #000; }}
-            .form-group {{ margin-bottom: 20px; }} .form-group label {{ display: block; margin-bottom: 8px; font-weight: 600; color: #333; }}
-            .form-group input {{ width: 100%; padding: 10px; box-sizing: border-box; border: 1px solid #ccc; border-radius: 6px; font-size: 16px; }}
-            #stock-list-header {{ display: grid; grid-template-columns: 2fr 2fr 1fr auto; gap: 10px; font-weight: 600; color: #555; padding: 0 10px 5px; border-bottom: 2px solid #eee; margin-bottom: 10px; }}
-            #stock-list .stock-item {{ display: grid; grid-template-columns: 2fr 2fr 1fr auto; gap: 10px; margin-bottom: 10px; align-items: center; }}
-            .stock-item input {{ padding: 8px; border: 1px solid #ddd; border-radius: 4px; }}
-            .delete-stock-btn {{ background-color: #e74c3c; color: white; border: none; width: 32px; height: 32px; border-radius: 50%; cursor: pointer; font-size: 16px; line-height: 32px; text-align: center; }}
-            .modal-footer {{ text-align: right; border-top: 1px solid #e5e5e5; padding-top: 20px; margin-top: 20px; }}
-            #add-stock-btn, #save-btn {{ background-color: #3498db; color: white; border: none; padding: 10px 18px; border-radius: 6px; cursor: pointer; font-size: 16px; font-weight: 600; }}
-            #add-stock-btn {{ background-color: #2ecc71; float: left; }}
-            #loader {{ text-align: center; display: none; margin-top: 15px; }}
-        </style>
-    </head><body>
-        <div id="portfolio-data" data-portfolio='{portfolio_json_str}'></div>
-        <div class="container">
-            <div class="header"><h1>个人资产报告</h1><div class="controls">
-                <span id="edit-btn" class="control-btn" title="编辑"><svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="currentColor"><path d="M3 17.25V21h3.75L17.81 9.94l-3.75-3.75L3 17.25zM20.71 7.04c.39-.39.39-1.02 0-1.41l-2.34-2.34a.9959.9959 0 0 0-1.41 0l-1.83 1.83 3.75 3.75 1.83-1.83z"/></svg></span>
-                <span id="visibility-toggle" class="control-btn" title="切换可见性"><svg id="eye-open" style="display:none;" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="currentColor"><path d="M12 4.5C7 4.5 2.73 7.61 1 12c1.73 4.39 6 7.5 11 7.5s9.27-3.11 11-7.5C3.27 7.61 7 4.5 12 4.5zm0 10c-2.76 0-5-2.24-5-5s2.24-5 5-5 5 2.24 5 5-2.24 5-5 5zm0-8c-1.66 0-3 1.34-3 3s1.34 3 3 3 3-1.34 3-3-1.34-3-3z"/></svg><svg id="eye-closed" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="currentColor"><path d="M12 7c2.76 0 5 2.24 5 5 0 .65-.13 1.26-.36 1.83l2.92 2.92c1.51-1.26 2.7-2.89 3.43-4.75C21.27 7.61 17 4.5 12 4.5c-1.4 0-2.74.25-3.98.7l2.16 2.16C10.74 7.13 11.35 7 12 7zM2 4.27l2.28 2.28.46.46C3.08 8.3 1.78 10.02 1 12c1.73 4.39 6 7.5 11 7.5 1.55 0 3.03-.3 4.38-.84l.42.42L19.73 22 21 20.73 3.27 3 2 4.27zM7.53 9.8l1.55 1.55c-.05.21-.08.43-.08.65 0 1.66 1.34 3 3 3 .22 0 .44-.03.65-.08l1.55 1.55c-.67.33-1.41.53-2.2.53-2.76 0-5-2.24-5-5 0-.79.2-1.53.53-2.2zm4.31-.78l3.15 3.15.02-.16c0-1.66-1.34-3-3-3l-.17.01z"/></svg></span>
-            </div></div>
-            <p class="report-time">报告生成时间: {now}</p>
-            <div id="main-content">{main_content_html}</div>
-        </div>
-        <div id="edit-modal" class="modal"><div class="modal-content">
-            <div class="modal-header"><h2>编辑持仓与负债</h2><span class="close-btn">&times;</span></div>
-            <div class="form-group"><label for="liabilities-input">总负债 (CNY)</label><input type="number" id="liabilities-input" value="{context['liabilities']}"></div>
-            <div class="form-group">
-                <label>持仓股票</label>
-                <div id="stock-list-header"><div>代码</div><div>名称</div><div>数量</div></div>
-                <div id="stock-list"></div>
-            </div>
-            <div id="loader"><p>正在保存...</p></div>
-            <div class="modal-footer">
-                <button id="add-stock-btn">增加股票</button>
-                <button id="save-btn">保存更改</button>
-            </div>
-        </div></div>
-        <script>
-            document.addEventListener('DOMContentLoaded', function() {{
-                const dataEl = document.getElementById('portfolio-data');
-                var portfolioData = JSON.parse(dataEl.dataset.portfolio.replace(/&quot;/g, '"').replace(/&apos;/g, "'"));
-                
-                const modal = document.getElementById('edit-modal');
-                const mainContent = document.getElementById('main-content');
-                let isDataVisible = false;
-
-                function setupControls() {{
-                    document.getElementById('edit-btn').addEventListener('click', () => {{
-                        const stockList = document.getElementById('stock-list');
-                        stockList.innerHTML = '';
-                        for (const [code, details] of Object.entries(portfolioData)) {{
-                            createStockItem(code, details.name, details.shares);
-                        }}
-                        modal.style.display = 'flex';
-                    }});
-                    document.getElementById('visibility-toggle').addEventListener('click', toggleVisibility);
-                }}
+    now = (datetime.fromtimestamp(generated_at) if generated_at else datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+    if main_content_html is None:
+        main_content_html = render_main_content_html(context)
+    return REPORT_TEMPLATE.render(portfolio=context['portfolio'], liabilities=context['liabilities'],
+                                  generated_at=now, main_content_html=main_content_html, portfolio_id=portfolio_id,
+                                  config_version=context.get('config_version', 0))
+
+# --- 快照预计算 ---
+def load_config(portfolio_id=DEFAULT_PORTFOLIO_ID):
+    # Read the portfolio's config object from Redis
+    config_json = r.get(config_key(portfolio_id))
+
+    if config_json is not None:
+        return json.loads(config_json)
+    # Named portfolios start empty and are only persisted on their first update
+    if portfolio_id != DEFAULT_PORTFOLIO_ID:
+        return {"portfolio": {}, "liabilities": 0}
+
+    # If the default object doesn't exist, use defaults and save it
+    print("未在Redis中找到 'asset_config'，正在使用默认值并创建...")
+    config = {"portfolio": DEFAULT_PORTFOLIO, "liabilities": DEFAULT_LIABILITIES_CNY}
+    try:
+        r.set('asset_config', json.dumps(config))
+    except Exception as e:
+        print(f"创建默认配置失败: {e}")
+    return config
 
-                function createStockItem(code = '', name = '', shares = '') {{
-                    const stockList = document.getElementById('stock-list');
-                    const div = document.createElement('div');
-                    div.className = 'stock-item';
-                    div.innerHTML = `
-                        <input placeholder="e.g., 002594.SZ" value="${{code}}">
-                        <input placeholder="e.g., 比亚迪" value="${{name}}">
-                        <input type="number" placeholder="e.g., 10000" value="${{shares}}">
-                        <button class="delete-stock-btn">&times;</button>`;
-                    div.querySelector('.delete-stock-btn').addEventListener('click', () => div.remove());
-                    stockList.appendChild(div);
-                }}
+def missing_quotes(context, baseline):
+    """Holdings priced in ``baseline`` (an earlier report context) that ``context`` has no price for.
 
-                function toggleVisibility() {{
-                    isDataVisible = !isDataVisible;
-                    document.querySelectorAll('.sensitive-data').forEach(el => {{
-                        el.textContent = isDataVisible ? el.dataset.value : '***';
-                    }});
-                    document.getElementById('eye-open').style.display = isDataVisible ? 'block' : 'none';
-                    document.getElementById('eye-closed').style.display = isDataVisible ? 'none' : 'block';
-                }}
-                
-                document.getElementById('add-stock-btn').addEventListener('click', () => createStockItem());
-                modal.querySelector('.close-btn').addEventListener('click', () => modal.style.display = 'none');
-
-                document.getElementById('save-btn').addEventListener('click', async () => {{
-                    const newPortfolio = {{}};
-                    document.querySelectorAll('#stock-list .stock-item').forEach(item => {{
-                        const inputs = item.querySelectorAll('input');
-                        if (inputs.length === 3 && inputs[0].value) {{
-                            newPortfolio[inputs[0].value.trim()] = {{ name: inputs[1].value.trim(), shares: parseInt(inputs[2].value, 10) }};
-                        }}
-                    }});
-                    const newLiabilities = parseFloat(document.getElementById('liabilities-input').value);
-
-                    const loader = document.getElementById('loader');
-                    loader.style.display = 'block';
-
-                    try {{
-                        const response = await fetch('/api/update', {{
-                            method: 'POST',
-                            headers: {{ 'Content-Type': 'application/json' }},
-                            body: JSON.stringify({{ portfolio: newPortfolio, liabilities: newLiabilities }})
-                        }});
-                        const result = await response.json();
-                        if (!response.ok) throw new Error(result.error || '保存失败');
-                        
-                        mainContent.innerHTML = result.html;
-                        portfolioData = result.portfolio;
-                        const newDataEl = document.getElementById('portfolio-data');
-                        newDataEl.dataset.portfolio = JSON.stringify(result.portfolio).replace(/'/g, "&apos;").replace(/"/g, "&quot;");
-
-                        //toggleVisibility(); // Re-apply visibility state
-                        modal.style.display = 'none';
-                    }} catch (error) {{
-                        alert('保存时出错: ' + error.message);
-                    }} finally {{
-                        loader.style.display = 'none';
-                    }}
-                }});
-                
-                modal.addEventListener('click', (e) => {{ if (e.target === modal) modal.style.display = 'none'; }});
-                setupControls();
-                //toggleVisibility();
-            }});
-        </script>
-    </body></html>"""
+    A non-empty portfolio without a single price counts every holding as missing.
+    """
+    priced, portfolio = context['all_data'], context['portfolio']
+    if portfolio and not priced:
+        return sorted(portfolio)
+    previous = baseline['all_data'] if baseline is not None else {}
+    return sorted(c for c in previous if c in portfolio and c not in priced)
+
+def history_time(portfolio, last, now):
+    """When to record a history point for a build at ``now``, or None if no quote can have changed since ``last``.
+
+    While markets are closed the point is stamped at settlement (plus the grace
+    period), so rollup buckets only fall on trading days.
+    """
+    is_open, settled_at, _ = CALENDAR.quote_window({market_for_code(c) for c in portfolio},
+                                                   datetime.fromtimestamp(now, CST))
+    if is_open or settled_at is None:
+        return now
+    settled = settled_at.timestamp() + QUOTE_SETTLE_GRACE_SECONDS
+    if last is not None and last >= settled:
+        return None
+    return min(now, settled)
+
+def build_snapshot(portfolio_id, config, previous=None):
+    """Runs the fetch + render pipeline for ``config`` and stores the result.
+
+    ``previous`` is the snapshot being replaced; if still fresh, its data is reused.
+    History gets a point only when a quote can have changed since the last one
+    (see ``history_time``). A build missing quotes the last snapshot had (a
+    failed or partial fetch) is neither saved nor written to history: the last
+    good snapshot stays in place and the unsaved build is returned with
+    ``status: 'degraded'``. If the config was edited during the build, the
+    edit's snapshot is kept and returned with ``status: 'superseded'``.
+    """
+    reuse = previous['context'] if previous is not None and not is_snapshot_stale(previous) else None
+    baseline = previous if previous is not None else snapshot_store(portfolio_id).load()
+    weights = {code: row['weight'] for code, row in baseline['context']['all_data'].items()} if baseline else None
+    context = get_report_context(config.get('portfolio', {}), config.get('liabilities', 0), previous=reuse,
+                                 weights=weights)
+    context['config_version'] = config.get('version', 0)
+    html = render_main_content_html(context)
+    missing = missing_quotes(context, baseline['context'] if baseline is not None else None)
+    if missing:
+        print(f"行情不完整，保留上一份快照且不写入历史净值: 缺少 {missing}")
+        return {'version': None, 'built_at': time.time(), 'context': context, 'html': html, 'status': 'degraded'}
+    store = snapshot_store(portfolio_id)
+    try:
+        with metrics.timed('snapshot_save'):
+            snapshot = store.save(context, html, config_version=context['config_version'])
+    except SnapshotConflict as e:
+        # 构建期间配置已被修改：保留修改后生成的快照，本次结果既不保存也不写入历史
+        print(f"快照构建期间配置已变更，放弃保存: {e}")
+        latest = store.load()
+        unsaved = {'version': None, 'built_at': time.time(), 'context': context, 'html': html}
+        return {**(latest or unsaved), 'status': 'superseded'}
+    except Exception as e:
+        print(f"保存快照失败: {e}")
+        return {'version': None, 'built_at': time.time(), 'context': context, 'html': html}
+    try:
+        with metrics.timed('history_write'):
+            history = history_store(portfolio_id)
+            ts = history_time(context['portfolio'], history.last_time(), snapshot['built_at'])
+            if ts is not None:
+                history.append(context, ts)
+    except Exception as e:
+        print(f"写入历史净值失败: {e}")
+    return snapshot
+
+def is_snapshot_stale(snapshot):
+    age = time.time() - snapshot['built_at']
+    if age >= SNAPSHOT_MAX_AGE:
+        return True
+    policy = quote_cache_policy(snapshot['context'].get('portfolio', {}))
+    if 'valid_after' in policy:
+        return snapshot['built_at'] < policy['valid_after']
+    return age >= policy['ttl']
+
+def is_snapshot_expired(snapshot):
+    """Past the window in which a stale snapshot may still be served while it refreshes."""
+    age = time.time() - snapshot['built_at']
+    if age >= SNAPSHOT_MAX_AGE + NEWS_STALE_TTL:
+        return True
+    policy = quote_cache_policy(snapshot['context'].get('portfolio', {}))
+    if 'valid_after' in policy:
+        return snapshot['built_at'] < policy['valid_after']
+    return age >= policy['ttl'] + policy['stale_ttl']
+
+def rebuild_snapshot(portfolio_id, current=None):
+    """Rebuilds inline for a missing or expired snapshot and returns the one to serve.
+
+    Keeps serving ``current`` while another request holds the rebuild lock or
+    when the rebuild comes back degraded.
+    """
+    store = snapshot_store(portfolio_id)
+    token = store.acquire_lock()
+    if token is None and current is not None:
+        return current  # 其他请求正在重建
+    try:
+        with cache.inline_refresh():
+            snapshot = build_snapshot(portfolio_id, load_config(portfolio_id), previous=current)
+    finally:
+        if token is not None:
+            store.release_lock(token)
+    return current if current is not None and snapshot.get('status') == 'degraded' else snapshot
+
+def refresh_snapshot_in_background(portfolio_id):
+    """Best effort: Vercel may freeze the instance once the response is sent, pausing
+    the thread until the next warm invocation. Snapshots that stay unrefreshed past
+    their stale window are rebuilt inline by ``rebuild_snapshot`` instead.
+    """
+    store = snapshot_store(portfolio_id)
+    token = store.acquire_lock()
+    if token is None:
+        return  # 其他请求已在刷新
+
+    def run():
+        try:
+            with cache.inline_refresh():
+                build_snapshot(portfolio_id, load_config(portfolio_id))
+        except Exception as e:
+            print(f"后台刷新快照失败: {e}")
+        finally:
+            store.release_lock(token)
+            metrics.flush()
+    threading.Thread(target=run, daemon=True).start()
+
+def requested_portfolio_id():
+    return request.args.get('portfolio') or DEFAULT_PORTFOLIO_ID
+
+def empty_report_context():
+    """Context for a portfolio that has never been saved; rendering it needs no upstream data."""
+    return {"portfolio": {}, "liabilities": 0, "all_data": {}, "news_data": {}, "net_worth": 0,
+            "total_assets_cny": 0, "total_pnl_cny": 0, "total_pnl_percent": 0, "exposures": {}}
 
 # --- Flask Routes ---
+@app.before_request
+def begin_request_timing():
+    start_request()
+
+@app.after_request
+def record_request_metrics(response):
+    timing = server_timing()
+    if timing:
+        response.headers['Server-Timing'] = timing
+    metrics.inc('http_responses_total', endpoint=request.endpoint or 'unknown', status=response.status_code)
+    # 静态资源与 304 不触发写入，保持“不连接 Redis / 单次读取”；其余请求攒批写入
+    if request.endpoint != 'static_asset' and response.status_code != 304:
+        metrics.maybe_flush()
+    return response
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def show_report(path):
     if not r:
         return Response("<h1>错误: Redis 未配置</h1><p>请检查服务器环境变量 KV_REDIS_URL。</p>", status=500)
-
-    # Read the single config object from Redis
-    config_json = r.get('asset_config')
-
-    # If the object doesn't exist, use defaults and save it
-    if config_json is None:
-        print("未在Redis中找到 'asset_config'，正在使用默认值并创建...")
-        config = {"portfolio": DEFAULT_PORTFOLIO, "liabilities": DEFAULT_LIABILITIES_CNY}
-        try:
-            r.set('asset_config', json.dumps(config))
-        except Exception as e:
-            print(f"创建默认配置失败: {e}")
-    else:
-        config = json.loads(config_json)
-
-    context = get_report_context(config.get('portfolio', {}), config.get('liabilities', 0))
-    html_content = render_full_page_html(context)
+    portfolio_id = requested_portfolio_id()
+    if not is_valid_portfolio_id(portfolio_id):
+        return Response("<h1>错误: 无效的组合名称</h1><p>仅支持字母、数字、下划线和连字符，最长 32 个字符。</p>", status=400)
+    if not registry.is_registered(portfolio_id):
+        # 未注册的组合只渲染空白编辑页：不抓取行情、不写 Redis，首次保存时才由 /api/update 注册
+        return Response(render_full_page_html(empty_report_context(), portfolio_id=portfolio_id), mimetype='text/html',
+                        headers={'Cache-Control': 'no-cache'})
+
+    # Serve the precomputed snapshot; only build inline when none exists yet or it has expired
+    with metrics.timed('snapshot_load'):
+        snapshot = snapshot_store(portfolio_id).load()
+    if snapshot is None or is_snapshot_expired(snapshot):
+        snapshot = rebuild_snapshot(portfolio_id, snapshot)
+    elif is_snapshot_stale(snapshot):
+        refresh_snapshot_in_background(portfolio_id)
+
+    # 快照版本 + 静态资源与模板摘要构成 ETag：内容未变时直接返回 304，无需渲染
+    etag = None
+    if snapshot.get('version') is not None:
+        etag = f"{portfolio_id}:{snapshot['version']}:{assets.digest}:{TEMPLATES_DIGEST}:{SNAPSHOT_SCHEMA}"
+        if etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+    html_content = render_full_page_html(snapshot['context'], main_content_html=snapshot['html'],
+                                         generated_at=snapshot['built_at'], portfolio_id=portfolio_id)
     
     response = Response(html_content, mimetype='text/html')
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    if etag:
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/static/<filename>')
+def static_asset(filename):
+    asset = assets.lookup(filename)
+    if asset is None:
+        return Response("Not Found", status=404)
+    body, mimetype = asset
+    response = Response(body, mimetype=mimetype)
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
     return response
 
 @app.route('/api/update', methods=['POST'])
 def update_portfolio():
     if not r:
         return jsonify({'error': 'Redis not configured on server.'}), 500
+    portfolio_id = requested_portfolio_id()
+    if not is_valid_portfolio_id(portfolio_id):
+        return jsonify({'error': 'Invalid portfolio name.'}), 400
+    try:
+        new_config, expected_version = portfolio_config.validate(request.get_json(silent=True))
+    except ConfigError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        store = snapshot_store(portfolio_id)
+        previous_snapshot = store.load()
+        # Drop the old snapshot in the same transaction so it is never served with the new config
+        previous, saved = portfolio_config.save(
+            r, config_key(portfolio_id), new_config, expected_version,
+            on_commit=lambda pipe: (registry.register(portfolio_id, pipe), store.invalidate(pipe)))
+    except ConfigConflict as e:
+        return jsonify({'error': '配置已被其他页面修改，请刷新后重试。', 'version': e.current_version}), 409
+    except ConfigBusy as e:
+        print(f"保存配置失败: {e}")
+        return jsonify({'error': '配置正在被并发修改，请稍后重试。'}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        print(f"Error updating Redis: {e}")
+        return jsonify({'error': 'An internal error occurred.'}), 500
+
     try:
-        data = request.get_json()
-        if 'portfolio' not in data or 'liabilities' not in data:
-            return jsonify({'error': 'Invalid data format.'}), 400
-        
-        new_config = {"portfolio": data['portfolio'], "liabilities": data['liabilities']}
-        r.set('asset_config', json.dumps(new_config))
-        
-        # Immediately get fresh data and render the HTML snippet
-        context = get_report_context(new_config['portfolio'], new_config['liabilities'])
-        html_snippet = render_main_content_html(context)
-        
+        changes = portfolio_config.diff(previous, saved)
+        if saved is previous and previous_snapshot is not None:
+            snapshot = previous_snapshot  # 无变化：直接返回现有快照
+        else:
+            # Revalue from the replaced snapshot; only newly added symbols are fetched
+            snapshot = build_snapshot(portfolio_id, saved, previous=previous_snapshot)
         return jsonify({
-            'status': 'success', 
-            'html': html_snippet,
-            'portfolio': new_config['portfolio']
+            'status': snapshot.get('status', 'success'),
+            'html': snapshot['html'],
+            'portfolio': saved['portfolio'],
+            'version': saved.get('version', 0),
+            'changes': changes,
         })
     except Exception as e:
-        print(f"Error updating Redis: {e}")
+        print(f"Error rebuilding snapshot after update: {e}")
         return jsonify({'error': 'An internal error occurred.'}), 500
+
+@app.route('/api/snapshot', methods=['GET', 'POST'])
+def precompute_snapshot():
+    """Cron target: rebuilds every portfolio's snapshot so page loads are a single Redis read.
+
+    Quotes come from the shared per-market board, so the first build fetches the
+    union of all portfolios' symbols and the rest are served from cache. Stale
+    cache entries are refreshed inline rather than in background threads.
+    """
+    if not r:
+        return jsonify({'error': 'Redis not configured on server.'}), 500
+    if CRON_SECRET and request.headers.get('Authorization') != f"Bearer {CRON_SECRET}":
+        return jsonify({'error': 'Unauthorized.'}), 401
+    results = {}
+    for portfolio_id in registry.ids():
+        store = snapshot_store(portfolio_id)
+        token = store.acquire_lock()
+        if token is None:
+            results[portfolio_id] = {'status': 'busy'}
+            continue
+        try:
+            # 定时任务是主要刷新路径：过期缓存在本次请求内同步刷新，不依赖响应后可能被冻结的后台线程
+            with cache.inline_refresh():
+                snapshot = build_snapshot(portfolio_id, load_config(portfolio_id))
+            results[portfolio_id] = {'status': snapshot.get('status', 'success'), 'version': snapshot['version'],
+                                     'built_at': snapshot['built_at']}
+        except Exception as e:
+            print(f"预计算快照 {portfolio_id} 失败: {e}")
+            results[portfolio_id] = {'status': 'error'}
+        finally:
+            store.release_lock(token)
+    metrics.flush()
+    status = 'success' if all(result['status'] in ('success', 'busy', 'superseded') for result in results.values()) else 'degraded'
+    return jsonify({'status': status, 'portfolios': results, 'upstream': upstream.stats()})
+
+@app.route('/api/metrics', methods=['GET'])
+def export_metrics():
+    if not r:
+        return jsonify({'error': 'Redis not configured on server.'}), 500
+    if CRON_SECRET and request.headers.get('Authorization') != f"Bearer {CRON_SECRET}":
+        return jsonify({'error': 'Unauthorized.'}), 401
+    metrics.flush()
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/stream', methods=['GET'])
+def stream_updates():
+    """SSE endpoint sending compact price/P&L/total deltas from the shared market poll."""
+    if not r:
+        return jsonify({'error': 'Redis not configured on server.'}), 500
+    portfolio_id = requested_portfolio_id()
+    if not is_valid_portfolio_id(portfolio_id):
+        return jsonify({'error': 'Invalid portfolio name.'}), 400
+    if not registry.is_registered(portfolio_id):
+        return jsonify({'error': 'Unknown portfolio.'}), 404
+    # Start from what the page already shows so the first event is a real delta
+    snapshot = snapshot_store(portfolio_id).load()
+    if snapshot is not None:
+        context = snapshot['context']
+        portfolio, liabilities = context['portfolio'], context['liabilities']
+        initial_rows = context['all_data']
+        initial_totals = {'totals': {f: context[f] for f in TOTAL_FIELDS}}
+    else:
+        config = load_config(portfolio_id)
+        portfolio, liabilities = config.get('portfolio', {}), config.get('liabilities', 0)
+        initial_rows, initial_totals = {}, {}
+
+    def events():
+        from valuation import value_portfolio, rows
+        subscription = broadcaster.subscribe(portfolio)
+        sent_rows, sent_totals = initial_rows, initial_totals
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        try:
+            yield "retry: 3000\n\n"
+            while time.monotonic() < deadline:
+                try:
+                    tick = subscription.get(timeout=max(0.0, min(STREAM_HEARTBEAT_SECONDS, deadline - time.monotonic())))
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                # 轮询失败或只返回部分市场时，缺失的代码沿用已发送的价格，避免总额被算成 0
+                market_data = {**{code: {'price': row['price'], 'pre_close': row['pre_close']}
+                                  for code, row in sent_rows.items()}, **tick['market_data']}
+                if portfolio and not market_data:
+                    continue
+                valuation = value_portfolio(portfolio, market_data, {'CNY': 1.0, 'HKD': tick['hkd_cny_rate']})
+                current_rows = rows(portfolio, valuation)
+                current_totals = {'totals': {
+                    'total_assets_cny': valuation['total_assets_cny'], 'net_worth': valuation['total_assets_cny'] - liabilities,
+                    'total_pnl_cny': valuation['total_pnl_cny'], 'total_pnl_percent': valuation['total_pnl_percent'],
+                }}
+                delta = {'rows': diff(sent_rows, current_rows, ROW_FIELDS),
+                         'totals': diff(sent_totals, current_totals, TOTAL_FIELDS).get('totals', {})}
+                sent_rows, sent_totals = current_rows, current_totals
+                if delta['rows'] or delta['totals']:
+                    yield format_event('delta', delta, tick['seq'])
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def parse_history_time(value, default):
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).replace(tzinfo=CST).timestamp()
+
+def trading_day_mask(timestamps, markets):
+    """Whether each daily bucket start falls on a trading day of any of ``markets``."""
+    markets = markets or set(MARKET_LABELS)
+    return [any(CALENDAR.is_trading_day(m, datetime.fromtimestamp(ts, CST).date()) for m in markets)
+            for ts in timestamps]
+
+@app.route('/api/history', methods=['GET'])
+def get_history():
+    if not r_raw:
+        return jsonify({'error': 'Redis not configured on server.'}), 500
+    portfolio_id = requested_portfolio_id()
+    if not is_valid_portfolio_id(portfolio_id):
+        return jsonify({'error': 'Invalid portfolio name.'}), 400
+    try:
+        end = parse_history_time(request.args.get('to'), time.time())
+        start = parse_history_time(request.args.get('from'), end - 365 * 86400)
+    except ValueError:
+        return jsonify({'error': 'Invalid from/to, expected ISO date or unix timestamp.'}), 400
+    resolution = request.args.get('resolution', '1d')
+    codes = [c for c in request.args.get('codes', '').split(',') if c]
+    from valuation import risk_metrics, return_risk_metrics
+    try:
+        with metrics.timed('history_query'):
+            store = history_store(portfolio_id)
+            result = store.query(start, end, resolution, codes)
+            daily = result['totals'] if resolution == '1d' else store.query(start, end, '1d')['totals']
+        # 组合风险取自交易日的当日收益率（不含持仓增减与负债变化），而非总资产序列
+        markets = {market_for_code(c) for c in load_config(portfolio_id).get('portfolio', {})} - {None}
+        trading = trading_day_mask(daily['t'], markets)
+        result['totals']['risk'] = return_risk_metrics(
+            [pnl for pnl, keep in zip(daily['total_pnl_percent'], trading) if keep])
+        for code, series in result['holdings'].items():
+            prices = series['price']
+            if resolution == '1d':
+                prices = [p for p, keep in zip(prices, trading_day_mask(series['t'], {market_for_code(code)} - {None})) if keep]
+            series['risk'] = risk_metrics(prices, resolution)
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"查询历史净值失败: {e}")
+        return jsonify({'error': 'An internal error occurred.'}), 500
+
+@app.route('/api/news/<code>', methods=['GET'])
+def get_stock_news(code):
+    if not r:
+        return jsonify({'error': 'Redis not configured on server.'}), 500
+    limit = min(max(request.args.get('limit', 20, type=int), 1), news_store.per_stock_limit)
+    return jsonify({'code': code, 'news': read_news([code], limit)[code]})
@@ -0,0 +1,110 @@
+"""SSE/SZSE/HKEX trading calendar loaded from ``data/trading_calendar.json``.
+
+Sessions include the opening and closing auctions, so a time outside every
+session is a time at which no new quote can be printed. Holidays beyond the
+years listed in the data file fall back to the plain weekday rule; the file
+should be extended when each exchange publishes its next-year calendar.
+"""
+from datetime import datetime, date, time as dtime, timedelta, timezone
+import json
+import os
+
+DEFAULT_CALENDAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'trading_calendar.json')
+SEARCH_DAYS = 30  # longest closure we will scan across (e.g. Lunar New Year + weekends)
+
+SUFFIX_TO_MARKET = {'.SH': 'SSE', '.SZ': 'SZSE', '.HK': 'HKEX'}
+
+
+def market_for_code(code):
+    return SUFFIX_TO_MARKET.get(code[-3:].upper())
+
+
+def _parse_time(value):
+    hour, minute = value.split(':')
+    return dtime(int(hour), int(minute))
+
+
+class TradingCalendar:
+    def __init__(self, data):
+        self.tz = timezone(timedelta(hours=data.get('utc_offset_hours', 8)), 'CST')
+        self.markets = {}
+        raw_markets = data['markets']
+        for name, spec in raw_markets.items():
+            spec = raw_markets[spec['same_as']] if 'same_as' in spec else spec
+            self.markets[name] = {
+                'first_quote': _parse_time(spec['first_quote']),
+                'sessions': [(_parse_time(s), _parse_time(e)) for s, e in spec['sessions']],
+                'holidays': {date.fromisoformat(d) for d in spec.get('holidays', [])},
+                'special_sessions': {
+                    date.fromisoformat(d): [(_parse_time(s), _parse_time(e)) for s, e in sessions]
+                    for d, sessions in spec.get('special_sessions', {}).items()
+                },
+            }
+
+    @classmethod
+    def load(cls, path=DEFAULT_CALENDAR_PATH):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _spec(self, market):
+        if market not in self.markets:
+            raise KeyError(f"Unknown market: {market}")
+        return self.markets[market]
+
+    def _now(self, now):
+        return now.astimezone(self.tz) if now else datetime.now(self.tz)
+
+    def is_trading_day(self, market, day):
+        return day.weekday() < 5 and day not in self._spec(market)['holidays']
+
+    def sessions(self, market, day):
+        """Returns the (start, end) datetimes of every session on ``day``, or [] if closed."""
+        if not self.is_trading_day(market, day):
+            return []
+        spec = self._spec(market)
+        times = spec['special_sessions'].get(day, spec['sessions'])
+        return [(datetime.combine(day, s, self.tz), datetime.combine(day, e, self.tz)) for s, e in times]
+
+    def first_quote_time(self, market, day):
+        """Earliest time a quote for ``day`` can exist (opening auction match), or None on closed days."""
+        if not self.is_trading_day(market, day):
+            return None
+        return datetime.combine(day, self._spec(market)['first_quote'], self.tz)
+
+    def is_open(self, market, now=None):
+        now = self._now(now)
+        return any(start <= now < end for start, end in self.sessions(market, now.date()))
+
+    def last_close(self, market, now=None):
+        """End of the most recent session that finished at or before ``now``."""
+        now = self._now(now)
+        for offset in range(SEARCH_DAYS):
+            day = now.date() - timedelta(days=offset)
+            ends = [end for _, end in self.sessions(market, day) if end <= now]
+            if ends:
+                return max(ends)
+        return None
+
+    def next_open(self, market, now=None):
+        """Start of the next session beginning after ``now``."""
+        now = self._now(now)
+        for offset in range(SEARCH_DAYS):
+            day = now.date() + timedelta(days=offset)
+            starts = [start for start, _ in self.sessions(market, day) if start > now]
+            if starts:
+                return min(starts)
+        return None
+
+    def quote_window(self, markets, now=None):
+        """Summarises whether quotes for ``markets`` can change right now.
+
+        Returns ``(is_open, settled_at, next_open)``: when no market is open,
+        a quote fetched after ``settled_at`` stays final until ``next_open``.
+        """
+        now = self._now(now)
+        markets = {m for m in markets if m}
+        if any(self.is_open(m, now) for m in markets):
+            return True, None, None
+        closes = [c for c in (self.last_close(m, now) for m in markets) if c]
+        opens = [o for o in (self.next_open(m, now) for m in markets) if o]
+        return False, max(closes) if closes else None, min(opens) if opens else None
@@ -0,0 +1,151 @@
+"""Counters, latency histograms and per-request stage timings.
+
+Samples are aggregated in-process and written to Redis with one pipeline per
+``flush()``, so totals survive across serverless invocations and every
+instance adds to the same series. Stored fields are already Prometheus sample
+names (``name{labels}``, cumulative ``_bucket`` series), so ``render()`` only
+has to group them under ``# TYPE`` lines.
+
+Request handlers call ``maybe_flush()``, which only writes once every
+``flush_every`` requests or ``flush_interval`` seconds, so most responses add
+no Redis round trip of their own.
+
+``timed(stage)`` also appends to the current request's stage list, which the
+app turns into a ``Server-Timing`` header. The list lives in a context
+variable; ``run_concurrently`` copies the context into its workers, so stages
+timed on fetch threads are reported too.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import re
+import threading
+import time
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LE_RE = re.compile(r',?le="([^"]+)"')
+
+_stage_timings = ContextVar('stage_timings', default=None)
+
+
+def _labels(labels):
+    escaped = {k: str(v).replace('\\', '\\\\').replace('"', '\\"') for k, v in labels.items()}
+    return ','.join(f'{k}="{v}"' for k, v in sorted(escaped.items()))
+
+
+def _sample(name, labels):
+    return f"{name}{{{labels}}}" if labels else name
+
+
+def _sort_key(item):
+    """Orders samples by series, then buckets by numeric ``le`` rather than as strings."""
+    sample = item[0]
+    match = LE_RE.search(sample)
+    return (LE_RE.sub('', sample), float(match.group(1)) if match else 0.0)
+
+
+def start_request():
+    """Starts collecting stage timings for the current request."""
+    _stage_timings.set([])
+
+
+def server_timing():
+    """``Server-Timing`` header value for the current request (longest run per stage), or None."""
+    timings = _stage_timings.get()
+    if not timings:
+        return None
+    longest = {}
+    for stage, seconds in timings:
+        longest[stage] = max(seconds, longest.get(stage, 0.0))
+    return ', '.join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in longest.items())
+
+
+class Metrics:
+    def __init__(self, client, key_prefix='metrics', flush_every=20, flush_interval=60.0):
+        self.client = client
+        self.samples_key = f"{key_prefix}:samples"
+        self.types_key = f"{key_prefix}:types"
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.types = {}
+        self.unflushed_requests = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        sample = _sample(name, _labels(labels))
+        with self.lock:
+            self.types[name] = 'counter'
+            self.pending[sample] = self.pending.get(sample, 0) + amount
+
+    def observe(self, name, value, **labels):
+        label_str = _labels(labels)
+        prefix = f"{label_str}," if label_str else ''
+        # Buckets below the value get +0 so every bucket series exists from the first observation
+        samples = [(f'{name}_bucket{{{prefix}le="{le}"}}', int(value <= le)) for le in BUCKETS]
+        samples.append((f'{name}_bucket{{{prefix}le="+Inf"}}', 1))
+        samples.append((_sample(f"{name}_count", label_str), 1))
+        with self.lock:
+            self.types[name] = 'histogram'
+            for sample, amount in samples:
+                self.pending[sample] = self.pending.get(sample, 0) + amount
+            sum_sample = _sample(f"{name}_sum", label_str)
+            self.pending[sum_sample] = self.pending.get(sum_sample, 0) + value
+
+    @contextmanager
+    def timed(self, stage):
+        """Times the block into ``stage_duration_seconds{stage=...}`` and the request's Server-Timing."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe('stage_duration_seconds', elapsed, stage=stage)
+            timings = _stage_timings.get()
+            if timings is not None:
+                timings.append((stage, elapsed))
+
+    def maybe_flush(self):
+        """Counts one finished request and flushes if enough requests or time have passed."""
+        with self.lock:
+            self.unflushed_requests += 1
+            due = (self.unflushed_requests >= self.flush_every
+                   or time.monotonic() - self.last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Adds everything recorded since the last flush to the Redis totals."""
+        with self.lock:
+            pending, types = self.pending, self.types
+            self.pending, self.types = {}, {}
+            self.unflushed_requests, self.last_flush = 0, time.monotonic()
+        if not pending or self.client is None:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for sample, amount in pending.items():
+                pipe.hincrbyfloat(self.samples_key, sample, amount)
+            pipe.hset(self.types_key, mapping=types)
+            pipe.execute()
+        except Exception as e:
+            print(f"写入监控指标失败: {e}")
+
+    def render(self):
+        """All stored series in the Prometheus text exposition format."""
+        samples = self.client.hgetall(self.samples_key)
+        types = self.client.hgetall(self.types_key)
+        families = {}
+        for sample, value in samples.items():
+            base = sample.split('{', 1)[0]
+            for suffix in ('_bucket', '_count', '_sum'):
+                if base.endswith(suffix) and types.get(base[:-len(suffix)]) == 'histogram':
+                    base = base[:-len(suffix)]
+                    break
+            families.setdefault(base, []).append((sample, value))
+        lines = []
+        for name in sorted(families):
+            lines.append(f"# TYPE {name} {types.get(name, 'untyped')}")
+            lines.extend(f"{sample} {float(value)}" for sample, value in sorted(families[name], key=_sort_key))
+        return '\n'.join(lines) + '\n'
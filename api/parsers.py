@@ -0,0 +1,154 @@
+"""Pluggable HTML extraction for the news and FX scrapers.
+
+Backends, fastest first:
+- ``regex``: slices out the target region and scans it with a precompiled
+  pattern, without building a DOM; news items are yielded lazily.
+- ``selectolax`` / ``lxml``: C-backed DOM parsers, used when installed.
+- ``bs4``: BeautifulSoup with ``html.parser``, the original behaviour.
+
+In ``auto`` mode the regex path runs first and any page it cannot recognise
+falls through to the best available DOM backend. ``HTML_PARSER_BACKEND``
+forces a single backend.
+"""
+from html import unescape
+import importlib.util
+import os
+import re
+
+NEWS_DATE_RE = re.compile(r'(\d{4}-\d{2}-\d{2})(?:\s+(\d{2}:\d{2}))?')
+NEWS_LINK_RE = re.compile(r'<a\b[^>]*?href=["\']([^"\']+)["\'][^>]*>(.*?)</a>', re.S | re.I)
+NEWS_CONTAINER_RE = re.compile(r'<div[^>]*class=["\'][^"\']*\bdatelist\b[^"\']*["\'][^>]*>', re.I)
+TAG_RE = re.compile(r'<[^>]+>')
+FX_RE = re.compile(r'<div[^>]*class=["\']YMlKec fxKbKc["\'][^>]*>\s*([\d.,]+)\s*</div>')
+
+DOM_BACKENDS = [name for name in ('selectolax', 'lxml') if importlib.util.find_spec(name)] + ['bs4']
+BACKENDS = ['regex'] + DOM_BACKENDS
+
+
+class ParseError(ValueError):
+    pass
+
+
+def _news_item(title, url, prefix):
+    date_match = NEWS_DATE_RE.search(prefix)
+    date_str = ' '.join(filter(None, date_match.groups())) if date_match else ""
+    return {'title': title.strip(), 'url': url, 'source_time': date_str}
+
+
+# --- regex ---
+def _regex_news(html):
+    container = NEWS_CONTAINER_RE.search(html)
+    if not container:
+        raise ParseError("datelist not found")
+    start = container.end()
+    end = html.find('</div>', start)
+    region = html[start:end if end != -1 else len(html)]
+    position = 0
+    for match in NEWS_LINK_RE.finditer(region):
+        # The date/time is the text right before each link
+        prefix = unescape(TAG_RE.sub(' ', region[position:match.start()]))
+        position = match.end()
+        yield _news_item(unescape(TAG_RE.sub('', match.group(2))), unescape(match.group(1)), prefix)
+
+
+def _regex_fx(html):
+    match = FX_RE.search(html)
+    if not match:
+        raise ParseError("FX rate node not found")
+    return float(match.group(1).replace(',', ''))
+
+
+# --- selectolax ---
+def _selectolax_news(html):
+    from selectolax.parser import HTMLParser
+    container = HTMLParser(html).css_first('div.datelist')
+    if container is None:
+        return
+    for link in container.css('a'):
+        prev = link.prev
+        prefix = prev.text(deep=False) if prev is not None and prev.tag == '-text' else ''
+        yield _news_item(link.text(), link.attributes.get('href', ''), prefix)
+
+
+def _selectolax_fx(html):
+    from selectolax.parser import HTMLParser
+    node = HTMLParser(html).css_first('div.YMlKec.fxKbKc')
+    if node is None:
+        raise ParseError("FX rate node not found")
+    return float(node.text().replace(',', ''))
+
+
+# --- lxml ---
+def _lxml_news(html):
+    import lxml.html
+    containers = lxml.html.document_fromstring(html).find_class('datelist')
+    if not containers:
+        return
+    for link in containers[0].iter('a'):
+        prev = link.getprevious()
+        prefix = (prev.tail if prev is not None else link.getparent().text) or ''
+        yield _news_item(link.text_content(), link.get('href', ''), prefix)
+
+
+def _lxml_fx(html):
+    import lxml.html
+    nodes = [n for n in lxml.html.document_fromstring(html).find_class('fxKbKc') if 'YMlKec' in n.get('class', '')]
+    if not nodes:
+        raise ParseError("FX rate node not found")
+    return float(nodes[0].text_content().replace(',', ''))
+
+
+# --- bs4 (original behaviour) ---
+def _bs4_news(html):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    news_container = soup.find('div', class_='datelist')
+    if not news_container:
+        return
+    for item in news_container.find_all('a'):
+        prefix = item.previous_sibling if isinstance(item.previous_sibling, str) else ''
+        yield _news_item(item.text, item['href'], prefix)
+
+
+def _bs4_fx(html):
+    from bs4 import BeautifulSoup
+    return float(BeautifulSoup(html, 'html.parser').find('div', class_='YMlKec fxKbKc').text)
+
+
+NEWS_EXTRACTORS = {'regex': _regex_news, 'selectolax': _selectolax_news, 'lxml': _lxml_news, 'bs4': _bs4_news}
+FX_EXTRACTORS = {'regex': _regex_fx, 'selectolax': _selectolax_fx, 'lxml': _lxml_fx, 'bs4': _bs4_fx}
+
+
+def _selected(backend):
+    backend = backend or os.environ.get('HTML_PARSER_BACKEND', 'auto')
+    if backend != 'auto' and backend not in BACKENDS:
+        raise ValueError(f"Unavailable HTML parser backend: {backend} (available: {BACKENDS})")
+    return backend
+
+
+def iter_news(html, backend=None):
+    """Yields ``{'title', 'url', 'source_time'}`` dicts from a Sina vCB_AllNewsStock page, newest first."""
+    backend = _selected(backend)
+    if backend != 'auto':
+        yield from NEWS_EXTRACTORS[backend](html)
+        return
+    try:
+        items = _regex_news(html)
+        first = next(items, None)
+    except ParseError:
+        yield from NEWS_EXTRACTORS[DOM_BACKENDS[0]](html)
+        return
+    if first is not None:
+        yield first
+        yield from items
+
+
+def parse_fx_rate(html, backend=None):
+    """Extracts the rate from a Google Finance currency quote page."""
+    backend = _selected(backend)
+    if backend != 'auto':
+        return FX_EXTRACTORS[backend](html)
+    try:
+        return _regex_fx(html)
+    except ParseError:
+        return FX_EXTRACTORS[DOM_BACKENDS[0]](html)
@@ -0,0 +1,119 @@
+"""Validation, diffing and optimistic-concurrency saves for a portfolio's stored config."""
+import json
+import math
+import os
+import re
+
+CODE_RE = re.compile(r'^(\d{6}\.(SH|SZ)|\d{5}\.HK)$')
+MAX_HOLDINGS = int(os.environ.get('MAX_HOLDINGS', 10000))
+MAX_NAME_LENGTH = 64
+
+
+class ConfigError(ValueError):
+    pass
+
+
+class ConfigConflict(Exception):
+    """The stored config changed since the editor loaded it."""
+
+    def __init__(self, current_version):
+        super().__init__(f"config is at version {current_version}")
+        self.current_version = current_version
+
+
+class ConfigBusy(Exception):
+    """Concurrent writers kept the save from committing within its retries."""
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def validate(payload):
+    """Returns ``(config, expected_version)`` from an ``/api/update`` body or raises ``ConfigError``.
+
+    Codes are normalised to upper case, blank names default to the code, and
+    ``version`` (the config version the editor started from) is optional.
+    """
+    if not isinstance(payload, dict):
+        raise ConfigError("请求体必须是 JSON 对象")
+    portfolio, liabilities = payload.get('portfolio'), payload.get('liabilities')
+    if not isinstance(portfolio, dict):
+        raise ConfigError("portfolio 必须是对象")
+    if len(portfolio) > MAX_HOLDINGS:
+        raise ConfigError(f"持仓数量不能超过 {MAX_HOLDINGS}")
+    if not _is_number(liabilities) or liabilities < 0:
+        raise ConfigError("liabilities 必须是非负数")
+    version = payload.get('version')
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool) or version < 0):
+        raise ConfigError("version 必须是非负整数")
+
+    holdings = {}
+    for raw_code, details in portfolio.items():
+        code = raw_code.strip().upper()
+        if not CODE_RE.match(code):
+            raise ConfigError(f"无效的股票代码: {raw_code}（示例: 600895.SH、002594.SZ、00700.HK）")
+        if code in holdings:
+            raise ConfigError(f"重复的股票代码: {code}")
+        if not isinstance(details, dict):
+            raise ConfigError(f"{code}: 持仓信息必须是对象")
+        shares = details.get('shares')
+        if not isinstance(shares, int) or isinstance(shares, bool) or shares <= 0:
+            raise ConfigError(f"{code}: 持股数量必须是正整数")
+        name = details.get('name') or code
+        if not isinstance(name, str) or len(name.strip()) > MAX_NAME_LENGTH:
+            raise ConfigError(f"{code}: 名称必须是不超过 {MAX_NAME_LENGTH} 个字符的字符串")
+        holding = {'shares': shares, 'name': name.strip() or code}
+        if isinstance(details.get('sector'), str) and details['sector'].strip():
+            holding['sector'] = details['sector'].strip()
+        holdings[code] = holding
+    return {'portfolio': holdings, 'liabilities': liabilities}, version
+
+
+def diff(old, new):
+    """Which holdings were added, removed or edited, and whether liabilities changed."""
+    old_portfolio, new_portfolio = (old or {}).get('portfolio', {}), new.get('portfolio', {})
+    return {
+        'added': sorted(set(new_portfolio) - set(old_portfolio)),
+        'removed': sorted(set(old_portfolio) - set(new_portfolio)),
+        'changed': sorted(c for c in set(old_portfolio) & set(new_portfolio) if old_portfolio[c] != new_portfolio[c]),
+        'liabilities': (old or {}).get('liabilities') != new.get('liabilities'),
+    }
+
+
+def is_empty(changes):
+    return not (changes['added'] or changes['removed'] or changes['changed'] or changes['liabilities'])
+
+
+def save(client, key, config, expected_version=None, on_commit=None, retries=3):
+    """Writes ``config`` under ``key`` as the next version, in one WATCH/MULTI transaction.
+
+    Raises ``ConfigConflict`` when ``expected_version`` is given and the stored
+    version differs, including when another writer commits mid-transaction, and
+    ``ConfigBusy`` when every retry lost the race.
+    ``on_commit(pipe)`` queues further commands into the same transaction.
+    Returns ``(previous, saved)``; an edit that changes nothing is not written
+    and returns the stored config as both.
+    """
+    from redis.exceptions import WatchError
+    for _ in range(retries):
+        try:
+            with client.pipeline() as pipe:
+                pipe.watch(key)
+                raw = pipe.get(key)
+                previous = json.loads(raw) if raw else None
+                current_version = (previous or {}).get('version', 0)
+                if expected_version is not None and expected_version != current_version:
+                    raise ConfigConflict(current_version)
+                if previous is not None and is_empty(diff(previous, config)):
+                    return previous, previous
+                saved = {**config, 'version': current_version + 1}
+                pipe.multi()
+                pipe.set(key, json.dumps(saved))
+                if on_commit:
+                    on_commit(pipe)
+                pipe.execute()
+                return previous, saved
+        except WatchError:
+            continue  # 并发写入：重新读取后再比较版本
+    raise ConfigBusy(f"{key} changed during all {retries} attempts")
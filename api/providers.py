@@ -0,0 +1,289 @@
+"""Market-data providers: batched quotes, FX rates and company news behind one interface.
+
+Providers only know how to build upstream requests and decode the responses;
+caching, P/L rules and valuation stay in the caller. Every provider issues its
+requests through a *transport* with the ``UpstreamClient.get(url, **kwargs)``
+signature, so the same provider can run against the live sites, record what it
+sees (``RecordingTransport``) or be served entirely from disk
+(``ReplayTransport``) for offline benchmarks and regression runs.
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, partial
+from urllib.parse import urlsplit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from concurrency import run_concurrently
+from upstream import UpstreamError
+import parsers
+
+CST = timezone(timedelta(hours=8), 'CST')
+
+
+class QuoteProvider(ABC):
+    """Batched real-time quotes.
+
+    ``fetch_quotes(codes)`` returns ``{code: {'price', 'pre_close', 'quoted_at'}}``
+    with ``quoted_at`` a timezone-aware datetime; unknown symbols are left out.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    @abstractmethod
+    def fetch_quotes(self, codes):
+        raise NotImplementedError
+
+
+class FxProvider(ABC):
+    """``fetch_rate(base, quote)`` returns how many ``quote`` one ``base`` buys."""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    @abstractmethod
+    def fetch_rate(self, base, quote):
+        raise NotImplementedError
+
+
+class NewsProvider(ABC):
+    """Company news with HTTP validators for conditional refreshes.
+
+    ``fetch_news(code, validators)`` returns None when the source reports no
+    change, otherwise ``(items, validators)`` where ``items`` yields
+    ``{'title', 'url', 'source_time'}`` dicts newest first.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    @abstractmethod
+    def fetch_news(self, code, validators=None):
+        raise NotImplementedError
+
+
+# --- Sina ---
+def sina_symbol(code):
+    """``600895.SH`` -> ``sh600895``, ``00700.HK`` -> ``hk00700``."""
+    number, suffix = code.split('.')
+    return f"{suffix.lower()}{number}"
+
+
+SINA_QUOTE_RE = re.compile(r'var hq_str_(\w+)="([^"]*)"')
+
+
+def parse_sina_quotes(content):
+    """Tokenizes a whole hq.sinajs.cn response in one pass into ``{symbol: fields}``."""
+    return {symbol: body.split(',') for symbol, body in SINA_QUOTE_RE.findall(content)}
+
+
+@lru_cache(maxsize=4096)
+def parse_quote_time(date_str, time_str, date_format):
+    """Quotes in one batch share a handful of timestamps, so each distinct one is parsed once."""
+    # HK quotes may omit seconds
+    time_format = f"{date_format} %H:%M" if time_str.count(':') == 1 else f"{date_format} %H:%M:%S"
+    return datetime.strptime(f"{date_str} {time_str}", time_format).replace(tzinfo=CST)
+
+
+class SinaQuoteProvider(QuoteProvider):
+    """Fetches quotes in URL-length-safe batches, in parallel when there is more than one."""
+
+    URL = "http://hq.sinajs.cn/list={}"
+    HEADERS = {'Referer': 'https://finance.sina.com.cn/'}
+    # (price, pre_close, date, time) field positions and the date format per feed
+    A_FIELDS, A_DATE_FORMAT = (3, 2, 30, 31), '%Y-%m-%d'
+    HK_FIELDS, HK_DATE_FORMAT = (6, 3, 17, 18), '%Y/%m/%d'
+
+    def __init__(self, transport, max_url_length=2000, timeout=8, max_workers=4):
+        super().__init__(transport)
+        self.max_url_length = max_url_length
+        self.timeout = timeout
+        self.max_workers = max_workers
+
+    def batches(self, symbols):
+        """Splits ``symbols`` so that no request URL exceeds ``max_url_length``."""
+        budget = self.max_url_length - len(self.URL.format(''))
+        batch, length = [], 0
+        for symbol in symbols:
+            added = len(symbol) + bool(batch)  # comma separator
+            if batch and length + added > budget:
+                yield batch
+                batch, length = [], 0
+                added = len(symbol)
+            batch.append(symbol)
+            length += added
+        if batch:
+            yield batch
+
+    def _fetch_batch(self, symbols):
+        response = self.transport.get(self.URL.format(','.join(symbols)), headers=self.HEADERS)
+        response.raise_for_status()
+        return parse_sina_quotes(response.text)
+
+    def fetch_quotes(self, codes):
+        if not codes:
+            return {}
+        symbols = {sina_symbol(c): c for c in codes}
+        batches = list(self.batches(list(symbols)))
+        if len(batches) == 1:
+            fields_by_symbol = self._fetch_batch(batches[0])
+        else:
+            results = run_concurrently({i: partial(self._fetch_batch, batch) for i, batch in enumerate(batches)},
+                                       timeout=self.timeout, max_workers=self.max_workers)
+            if all(result is None for result in results.values()):
+                raise UpstreamError(f"全部 {len(batches)} 个行情批次均失败")
+            fields_by_symbol = {k: v for result in results.values() if result for k, v in result.items()}
+
+        quotes = {}
+        for symbol, code in symbols.items():
+            parts = fields_by_symbol.get(symbol)
+            if parts is None:
+                continue
+            fields, date_format = (self.HK_FIELDS, self.HK_DATE_FORMAT) if symbol.startswith('hk') else (self.A_FIELDS, self.A_DATE_FORMAT)
+            if len(parts) <= max(fields):
+                continue
+            price_idx, pre_close_idx, date_idx, time_idx = fields
+            try:
+                quotes[code] = {
+                    'price': float(parts[price_idx]),
+                    'pre_close': float(parts[pre_close_idx]),
+                    'quoted_at': parse_quote_time(parts[date_idx], parts[time_idx], date_format),
+                }
+            except ValueError as e:
+                print(f"  - 解析 {code} 数据时出错: {e}")
+        return quotes
+
+
+class SinaNewsProvider(NewsProvider):
+    URL = "https://vip.stock.finance.sina.com.cn/corp/go.php/vCB_AllNewsStock/symbol/{}.phtml"
+
+    def fetch_news(self, code, validators=None):
+        validators = validators or {}
+        headers = {}
+        if validators.get('etag'): headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'): headers['If-Modified-Since'] = validators['last_modified']
+        response = self.transport.get(self.URL.format(sina_symbol(code)), headers=headers)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        response.encoding = 'gbk'
+        new_validators = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+        return parsers.iter_news(response.text), new_validators
+
+
+# --- Google Finance ---
+class GoogleFxProvider(FxProvider):
+    URL = "https://www.google.com/finance/quote/{}-{}"
+
+    def fetch_rate(self, base, quote):
+        response = self.transport.get(self.URL.format(base, quote))
+        response.raise_for_status()
+        return parsers.parse_fx_rate(response.text)
+
+
+QUOTE_PROVIDERS = {'sina': SinaQuoteProvider}
+FX_PROVIDERS = {'google': GoogleFxProvider}
+NEWS_PROVIDERS = {'sina': SinaNewsProvider}
+
+
+# --- record / replay ---
+class CapturedHeaders(dict):
+    """Case-insensitive header lookup, like ``requests``' header dict."""
+
+    def __init__(self, headers):
+        super().__init__((k.lower(), v) for k, v in headers.items())
+
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+
+class CapturedResponse:
+    """The subset of ``requests.Response`` the providers use, rebuilt from a capture."""
+
+    def __init__(self, url, status_code, headers, content, encoding):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CapturedHeaders(headers)
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise ReplayError(f"{self.status_code} from {self.url}")
+
+
+class ReplayError(Exception):
+    pass
+
+
+def capture_name(url):
+    return hashlib.sha1(url.encode()).hexdigest()[:16]
+
+
+def write_capture(directory, url, status_code, headers, content, encoding):
+    """Stores one response as ``<name>.json`` (metadata) plus ``<name>.body`` (raw bytes)."""
+    os.makedirs(directory, exist_ok=True)
+    name = capture_name(url)
+    with open(os.path.join(directory, f"{name}.body"), 'wb') as f:
+        f.write(content)
+    meta = {'url': url, 'status': status_code, 'headers': dict(headers), 'encoding': encoding}
+    with open(os.path.join(directory, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+
+
+class RecordingTransport:
+    """Passes requests through to ``transport`` and writes every response to ``directory``."""
+
+    def __init__(self, transport, directory):
+        self.transport = transport
+        self.directory = directory
+
+    def get(self, url, **kwargs):
+        response = self.transport.get(url, **kwargs)
+        write_capture(self.directory, url, response.status_code, response.headers, response.content, response.encoding)
+        return response
+
+
+class ReplayTransport:
+    """Serves captured responses from ``directory`` without touching the network.
+
+    ``latency`` is the simulated per-request delay in seconds, either one value
+    or a ``{host: seconds}`` dict (hosts not listed get no delay). Captures are
+    keyed by URL only; request headers such as validators are ignored.
+    """
+
+    def __init__(self, directory, latency=0.0):
+        self.directory = directory
+        self.latency = latency
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _load(self, url):
+        name = capture_name(url)
+        with self._lock:
+            if name not in self._cache:
+                try:
+                    with open(os.path.join(self.directory, f"{name}.json"), encoding='utf-8') as f:
+                        meta = json.load(f)
+                    with open(os.path.join(self.directory, f"{name}.body"), 'rb') as f:
+                        content = f.read()
+                except FileNotFoundError:
+                    raise ReplayError(f"没有 {url} 的录制响应") from None
+                self._cache[name] = (meta, content)
+            return self._cache[name]
+
+    def get(self, url, **kwargs):
+        delay = self.latency.get(urlsplit(url).hostname, 0.0) if isinstance(self.latency, dict) else self.latency
+        if delay:
+            time.sleep(delay)
+        meta, content = self._load(url)
+        return CapturedResponse(url, meta['status'], meta['headers'], content, meta['encoding'])
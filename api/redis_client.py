@@ -0,0 +1,27 @@
+"""Redis client that is created on first use rather than at import."""
+import threading
+
+
+class LazyRedis:
+    """Stands in for ``redis.Redis.from_url(url, **kwargs)`` until a command is issued.
+
+    Importing ``redis`` and building the connection pool are deferred to the first
+    attribute access, so cold starts for routes that never touch Redis skip both.
+    """
+
+    def __init__(self, url, **kwargs):
+        self._url = url
+        self._kwargs = kwargs
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import redis
+                    self._client = redis.Redis.from_url(self._url, **self._kwargs)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._connect(), name)
@@ -0,0 +1,84 @@
+"""Precomputed report snapshots stored in Redis so page loads need a single GET."""
+import json
+import time
+import uuid
+
+SNAPSHOT_SCHEMA = 4  # bump when the stored context/html layout changes
+
+
+class SnapshotConflict(Exception):
+    """The portfolio config changed while the snapshot was being built."""
+
+
+class SnapshotStore:
+    """Stores the latest report snapshot as one JSON document.
+
+    Each save gets a monotonically increasing ``version`` from a Redis counter;
+    documents written by an older ``SNAPSHOT_SCHEMA`` are ignored on load.
+    With ``config_key`` set, saves only commit while the stored config is still
+    at the version the snapshot was built from.
+    """
+
+    def __init__(self, client, key='snapshot:latest', lock_ttl=60, config_key=None):
+        self.client = client
+        self.key = key
+        self.version_key = f"{key}:version"
+        self.lock_key = f"lock:{key}"
+        self.lock_ttl = lock_ttl
+        self.config_key = config_key
+
+    def load(self):
+        try:
+            raw = self.client.get(self.key)
+        except Exception as e:
+            print(f"读取快照失败: {e}")
+            return None
+        if not raw:
+            return None
+        snapshot = json.loads(raw)
+        return snapshot if snapshot.get('schema') == SNAPSHOT_SCHEMA else None
+
+    def save(self, context, html, config_version=None, retries=3):
+        """Writes the next snapshot version in one WATCH/MULTI transaction.
+
+        Raises ``SnapshotConflict`` when ``config_version`` is given and the
+        config under ``config_key`` has moved on, so a build started before an
+        edit never replaces the edit's snapshot.
+        """
+        from redis.exceptions import WatchError
+        for _ in range(retries):
+            try:
+                with self.client.pipeline() as pipe:
+                    check_config = self.config_key is not None and config_version is not None
+                    pipe.watch(self.key, self.version_key, *([self.config_key] if check_config else []))
+                    if check_config:
+                        raw = pipe.get(self.config_key)
+                        stored_version = (json.loads(raw) if raw else {}).get('version', 0)
+                        if stored_version != config_version:
+                            raise SnapshotConflict(f"config is at version {stored_version}, built from {config_version}")
+                    snapshot = {
+                        'schema': SNAPSHOT_SCHEMA,
+                        'version': int(pipe.get(self.version_key) or 0) + 1,
+                        'built_at': time.time(),
+                        'context': context,
+                        'html': html,
+                    }
+                    pipe.multi()
+                    pipe.set(self.version_key, snapshot['version'])
+                    pipe.set(self.key, json.dumps(snapshot))
+                    pipe.execute()
+                    return snapshot
+            except WatchError:
+                continue  # 并发写入：重新读取后再检查
+        raise SnapshotConflict(f"{self.key} changed during all {retries} attempts")
+
+    def invalidate(self, pipe=None):
+        (pipe or self.client).delete(self.key)
+
+    def acquire_lock(self):
+        token = uuid.uuid4().hex
+        return token if self.client.set(self.lock_key, token, nx=True, ex=self.lock_ttl) else None
+
+    def release_lock(self, token):
+        if self.client.get(self.lock_key) == token:
+            self.client.delete(self.lock_key)
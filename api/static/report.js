@@ -0,0 +1,128 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const dataEl = document.getElementById('portfolio-data');
+    var portfolioData = JSON.parse(dataEl.textContent);
+    const portfolioId = dataEl.dataset.portfolioId;
+    let configVersion = parseInt(dataEl.dataset.configVersion, 10) || 0;
+
+    const modal = document.getElementById('edit-modal');
+    const mainContent = document.getElementById('main-content');
+    let isDataVisible = false;
+
+    function setupControls() {
+        document.getElementById('edit-btn').addEventListener('click', () => {
+            const stockList = document.getElementById('stock-list');
+            stockList.innerHTML = '';
+            for (const [code, details] of Object.entries(portfolioData)) {
+                createStockItem(code, details.name, details.shares);
+            }
+            modal.style.display = 'flex';
+        });
+        document.getElementById('visibility-toggle').addEventListener('click', toggleVisibility);
+    }
+
+    function createStockItem(code = '', name = '', shares = '') {
+        const stockList = document.getElementById('stock-list');
+        const div = document.createElement('div');
+        div.className = 'stock-item';
+        div.innerHTML = `
+            <input placeholder="e.g., 002594.SZ" value="${code}">
+            <input placeholder="e.g., 比亚迪" value="${name}">
+            <input type="number" placeholder="e.g., 10000" value="${shares}">
+            <button class="delete-stock-btn">&times;</button>`;
+        div.querySelector('.delete-stock-btn').addEventListener('click', () => div.remove());
+        stockList.appendChild(div);
+    }
+
+    // --- 实时推送：按字段就地更新表格与汇总 ---
+    let stream = null;
+    function fmt(n, digits) { return Number(n).toLocaleString('en-US', { minimumFractionDigits: digits, maximumFractionDigits: digits }); }
+    function setSensitive(el, text) {
+        if (!el) return;
+        el.dataset.value = text;
+        if (isDataVisible) el.textContent = text;
+    }
+    function setPnl(el, value, text) {
+        if (!el) return;
+        el.classList.toggle('pnl-positive', value >= 0);
+        el.classList.toggle('pnl-negative', value < 0);
+        el.textContent = text;
+    }
+    function arrow(value) { return value >= 0 ? '▲' : '▼'; }
+    function applyDelta(delta) {
+        for (const [code, f] of Object.entries(delta.rows || {})) {
+            const row = mainContent.querySelector(`tr[data-code="${code}"]`);
+            if (!row) continue;
+            const priceEl = row.querySelector('[data-field="price"]');
+            if ('price' in f) priceEl.textContent = Number(f.price).toFixed(2) + ' ' + priceEl.dataset.currency;
+            if ('market_value_cny' in f) setSensitive(row.querySelector('[data-field="market_value_cny"]'), fmt(f.market_value_cny, 2));
+            if ('pnl_cny' in f) setPnl(row.querySelector('[data-field="pnl_cny"]'), f.pnl_cny, `${arrow(f.pnl_cny)} ${fmt(Math.abs(f.pnl_cny), 2)}`);
+            if ('pnl_percent' in f) setPnl(row.querySelector('[data-field="pnl_percent"]'), f.pnl_percent, `${arrow(f.pnl_percent)} ${Math.abs(f.pnl_percent).toFixed(2)}%`);
+        }
+        const t = delta.totals || {};
+        const field = (name) => mainContent.querySelector(`[data-field="${name}"]`);
+        if ('total_assets_cny' in t) setSensitive(field('total_assets_cny'), fmt(t.total_assets_cny, 2));
+        if ('net_worth' in t) setSensitive(field('net_worth'), fmt(t.net_worth, 2));
+        if ('total_pnl_cny' in t) setPnl(field('total_pnl_cny'), t.total_pnl_cny, `${arrow(t.total_pnl_cny)} ${fmt(Math.abs(t.total_pnl_cny), 2)}`);
+        if ('total_pnl_percent' in t) setPnl(field('total_pnl_percent'), t.total_pnl_percent, `(${arrow(t.total_pnl_percent)} ${Math.abs(t.total_pnl_percent).toFixed(2)}%)`);
+    }
+    function connectStream() {
+        if (!window.EventSource) return;
+        if (stream) stream.close();
+        stream = new EventSource('/api/stream?portfolio=' + encodeURIComponent(portfolioId));
+        stream.addEventListener('delta', (e) => applyDelta(JSON.parse(e.data)));
+    }
+
+    function toggleVisibility() {
+        isDataVisible = !isDataVisible;
+        document.querySelectorAll('.sensitive-data').forEach(el => {
+            el.textContent = isDataVisible ? el.dataset.value : '***';
+        });
+        document.getElementById('eye-open').style.display = isDataVisible ? 'block' : 'none';
+        document.getElementById('eye-closed').style.display = isDataVisible ? 'none' : 'block';
+    }
+
+    document.getElementById('add-stock-btn').addEventListener('click', () => createStockItem());
+    modal.querySelector('.close-btn').addEventListener('click', () => modal.style.display = 'none');
+
+    document.getElementById('save-btn').addEventListener('click', async () => {
+        const newPortfolio = {};
+        document.querySelectorAll('#stock-list .stock-item').forEach(item => {
+            const inputs = item.querySelectorAll('input');
+            if (inputs.length === 3 && inputs[0].value) {
+                newPortfolio[inputs[0].value.trim()] = { name: inputs[1].value.trim(), shares: parseInt(inputs[2].value, 10) };
+            }
+        });
+        const newLiabilities = parseFloat(document.getElementById('liabilities-input').value);
+
+        const loader = document.getElementById('loader');
+        loader.style.display = 'block';
+
+        try {
+            const response = await fetch('/api/update?portfolio=' + encodeURIComponent(portfolioId), {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ portfolio: newPortfolio, liabilities: newLiabilities, version: configVersion })
+            });
+            const result = await response.json();
+            if (!response.ok) throw new Error(result.error || '保存失败');
+
+            mainContent.innerHTML = result.html;
+            portfolioData = result.portfolio;
+            configVersion = result.version;
+
+            //toggleVisibility(); // Re-apply visibility state
+            modal.style.display = 'none';
+            connectStream(); // 持仓已变化，重新订阅
+            if (result.status === 'degraded') alert('配置已保存，但部分行情获取失败，页面数值可能不完整。');
+        } catch (error) {
+            alert('保存时出错: ' + error.message);
+        } finally {
+            loader.style.display = 'none';
+        }
+    });
+
+    modal.addEventListener('click', (e) => { if (e.target === modal) modal.style.display = 'none'; });
+    setupControls();
+    connectStream();
+    //toggleVisibility();
+});
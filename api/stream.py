@@ -0,0 +1,82 @@
+"""Server-Sent Events fan-out: one shared market poll feeds every connected client."""
+import json
+import queue
+import threading
+import time
+
+ROW_FIELDS = ('price', 'market_value_cny', 'pnl_cny', 'pnl_percent')
+TOTAL_FIELDS = ('total_assets_cny', 'net_worth', 'total_pnl_cny', 'total_pnl_percent')
+
+
+class QuoteBroadcaster:
+    """Polls market data for the union of all subscribers' symbols on one thread.
+
+    Each subscriber gets a one-slot queue that always holds the newest tick, so a
+    slow client skips intermediate ticks instead of building a backlog. The poll
+    thread exits when the last subscriber leaves and restarts on the next one.
+    """
+
+    def __init__(self, poll, interval):
+        self.poll = poll
+        self.interval = interval
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.seq = 0
+
+    def subscribe(self, codes):
+        q = queue.Queue(maxsize=1)
+        with self.lock:
+            self.subscribers[q] = set(codes)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True, name='quote-broadcaster')
+                self.thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.pop(q, None)
+
+    def _publish(self, tick):
+        with self.lock:
+            targets = list(self.subscribers)
+        for q in targets:
+            try:
+                q.get_nowait()  # 丢弃未消费的旧数据，只保留最新一次
+            except queue.Empty:
+                pass
+            q.put_nowait(tick)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    return
+                codes = set().union(*self.subscribers.values())
+            started = time.monotonic()
+            try:
+                self.seq += 1
+                self._publish({'seq': self.seq, **self.poll(sorted(codes))})
+            except Exception as e:
+                print(f"推送行情轮询失败: {e}")
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+
+def diff(previous, current, fields):
+    """Returns only the fields of ``current`` that differ from ``previous``."""
+    changed = {}
+    for key, values in current.items():
+        before = previous.get(key, {})
+        fields_changed = {f: values[f] for f in fields if before.get(f) != values.get(f)}
+        if fields_changed:
+            changed[key] = fields_changed
+    return changed
+
+
+def format_event(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
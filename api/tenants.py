@@ -0,0 +1,57 @@
+"""Named portfolios: per-portfolio Redis keys and the registry used for shared quote fan-in.
+
+The ``default`` portfolio keeps the original un-suffixed keys (``asset_config``,
+``snapshot:latest``, ``history:*``) so existing deployments keep their data.
+"""
+import json
+import re
+
+DEFAULT_PORTFOLIO_ID = 'default'
+REGISTRY_KEY = 'portfolios'
+PORTFOLIO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+
+def is_valid_portfolio_id(portfolio_id):
+    return bool(PORTFOLIO_ID_RE.match(portfolio_id or ''))
+
+
+def config_key(portfolio_id):
+    return 'asset_config' if portfolio_id == DEFAULT_PORTFOLIO_ID else f'asset_config:{portfolio_id}'
+
+
+def snapshot_key(portfolio_id):
+    return 'snapshot:latest' if portfolio_id == DEFAULT_PORTFOLIO_ID else f'snapshot:{portfolio_id}:latest'
+
+
+def history_prefix(portfolio_id):
+    return 'history' if portfolio_id == DEFAULT_PORTFOLIO_ID else f'history:{portfolio_id}'
+
+
+class PortfolioRegistry:
+    def __init__(self, client, per_portfolio_limit=500):
+        self.client = client
+        self.per_portfolio_limit = per_portfolio_limit
+
+    def ids(self):
+        return sorted(set(self.client.smembers(REGISTRY_KEY)) | {DEFAULT_PORTFOLIO_ID})
+
+    def is_registered(self, portfolio_id):
+        return portfolio_id == DEFAULT_PORTFOLIO_ID or bool(self.client.sismember(REGISTRY_KEY, portfolio_id))
+
+    def register(self, portfolio_id, pipe=None):
+        (pipe or self.client).sadd(REGISTRY_KEY, portfolio_id)
+
+    def configs(self):
+        """Every registered portfolio's stored config, fetched with one MGET."""
+        ids = self.ids()
+        raw = self.client.mget([config_key(pid) for pid in ids])
+        return {pid: json.loads(value) for pid, value in zip(ids, raw) if value}
+
+    def symbol_universe(self):
+        """Union of holdings across all portfolios, so one quote batch can serve every tenant.
+
+        Each portfolio contributes at most ``per_portfolio_limit`` codes, so one
+        large portfolio cannot grow every other tenant's quote refresh.
+        """
+        return {code for config in self.configs().values()
+                for code in list(config.get('portfolio', {}))[:self.per_portfolio_limit]}
@@ -0,0 +1,219 @@
+"""Shared HTTP client for upstream data sources.
+
+Every request goes through a per-host policy: a dedicated keep-alive connection
+pool, a concurrency cap, bounded retries with full-jitter backoff and a circuit
+breaker that fails fast while a host keeps erroring. Per-host request, error
+and latency counters are kept in-process and exposed via ``stats()``.
+
+``requests`` is imported when the first request is made, so cold starts that
+only serve cached data never load it.
+"""
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+import random
+import threading
+import time
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Base class for failures raised by the upstream client itself."""
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class HostBusyError(UpstreamError):
+    pass
+
+
+@dataclass
+class HostPolicy:
+    pool_size: int = 4
+    max_concurrency: int = 4
+    timeout: tuple = (3, 10)  # (connect, read) seconds
+    retries: int = 2
+    backoff_base: float = 0.2
+    backoff_max: float = 2.0
+    queue_timeout: float = 5.0
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+
+
+class CircuitBreaker:
+    """closed -> open after ``failure_threshold`` consecutive failures; after
+    ``reset_timeout`` a single half-open trial decides whether to close again."""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def cancel_trial(self):
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record(self, success):
+        with self.lock:
+            self.trial_in_flight = False
+            if success:
+                self.failures, self.opened_at = 0, None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class HostStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = self.errors = self.retries = self.short_circuited = 0
+        self.latency_count = 0
+        self.latency_sum = self.latency_max = 0.0
+
+    def observe(self, latency, error):
+        with self.lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.latency_count += 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': self.requests, 'errors': self.errors, 'retries': self.retries,
+                'short_circuited': self.short_circuited,
+                'latency_avg_ms': self.latency_sum / self.latency_count * 1000 if self.latency_count else 0.0,
+                'latency_max_ms': self.latency_max * 1000,
+            }
+
+
+class UpstreamClient:
+    """With ``metrics`` set, per-host counters and latency histograms are also
+    recorded there (``upstream_requests_total``, ``upstream_request_duration_seconds``)."""
+
+    def __init__(self, policies=None, default_policy=None, headers=None, metrics=None):
+        self.metrics = metrics
+        self.policies = policies or {}
+        self.default_policy = default_policy or HostPolicy()
+        self.headers = headers or {}
+        self._session = None
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+        for host, policy in self.policies.items():
+            self._host(host, policy)
+
+    @property
+    def session(self):
+        """The shared ``requests.Session``, created with every known host's pool on first use."""
+        if self._session is None:
+            import requests
+            with self._hosts_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    session.headers.update(self.headers)
+                    for host, entry in self._hosts.items():
+                        self._mount(session, host, entry['policy'])
+                    self._session = session
+        return self._session
+
+    @staticmethod
+    def _mount(session, host, policy):
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=policy.pool_size, max_retries=0)
+        for scheme in ('http', 'https'):
+            session.mount(f"{scheme}://{host}/", adapter)
+
+    def _host(self, host, policy=None):
+        with self._hosts_lock:
+            if host not in self._hosts:
+                policy = policy or self.policies.get(host, self.default_policy)
+                if self._session is not None:
+                    self._mount(self._session, host, policy)
+                self._hosts[host] = {
+                    'policy': policy,
+                    'semaphore': threading.BoundedSemaphore(policy.max_concurrency),
+                    'breaker': CircuitBreaker(policy.failure_threshold, policy.reset_timeout),
+                    'stats': HostStats(),
+                }
+            return self._hosts[host]
+
+    def get(self, url, **kwargs):
+        """GETs ``url`` under its host policy.
+
+        Returns the response for any non-retryable status (callers still decide
+        what a 4xx means). Raises ``CircuitOpenError`` immediately while the host's
+        breaker is open, ``HostBusyError`` if no concurrency slot frees up in time,
+        and the last request error once retries are exhausted.
+        """
+        import requests
+        session = self.session
+        host = urlsplit(url).hostname
+        entry = self._host(host)
+        policy, breaker, stats = entry['policy'], entry['breaker'], entry['stats']
+        kwargs.setdefault('timeout', policy.timeout)
+
+        for attempt in range(policy.retries + 1):
+            if not breaker.allow():
+                with stats.lock:
+                    stats.short_circuited += 1
+                self._record(host, 'short_circuited')
+                raise CircuitOpenError(f"{host} 熔断中，暂停请求")
+            if not entry['semaphore'].acquire(timeout=policy.queue_timeout):
+                breaker.cancel_trial()
+                raise HostBusyError(f"{host} 并发请求已满")
+            started = time.monotonic()
+            error = None
+            try:
+                response = session.get(url, **kwargs)
+                if response.status_code in RETRYABLE_STATUS:
+                    error = requests.HTTPError(f"{response.status_code} from {host}", response=response)
+            except requests.RequestException as e:
+                error = e
+            finally:
+                entry['semaphore'].release()
+            latency = time.monotonic() - started
+            stats.observe(latency, error is not None)
+            breaker.record(error is None)
+            self._record(host, 'error' if error else 'ok', latency)
+            if error is None:
+                return response
+            if attempt == policy.retries:
+                raise error
+            with stats.lock:
+                stats.retries += 1
+            time.sleep(random.uniform(0, min(policy.backoff_max, policy.backoff_base * 2 ** attempt)))
+
+    def _record(self, host, outcome, latency=None):
+        if self.metrics is None:
+            return
+        self.metrics.inc('upstream_requests_total', host=host, outcome=outcome)
+        if latency is not None:
+            self.metrics.observe('upstream_request_duration_seconds', latency, host=host)
+
+    def stats(self):
+        with self._hosts_lock:
+            hosts = dict(self._hosts)
+        return {host: {**entry['stats'].snapshot(), 'circuit': entry['breaker'].state} for host, entry in hosts.items()}
@@ -0,0 +1,127 @@
+"""Columnar portfolio valuation and risk metrics on NumPy arrays.
+
+Holdings, prices and FX rates are loaded into parallel float64 arrays once, so
+totals, exposures, weights and P/L contribution are computed in batch rather
+than one holding dict at a time.
+"""
+import numpy as np
+
+from market_calendar import market_for_code
+
+PERIODS_PER_YEAR = {'1d': 252, '1w': 52, '1m': 12}
+
+
+def currency_for_code(code):
+    return 'HKD' if code.endswith('.HK') else 'CNY'
+
+
+def _encode(labels):
+    """Maps a label list to (unique_labels, index_array) for bincount-style grouping."""
+    uniques = sorted(set(labels))
+    lookup = {label: i for i, label in enumerate(uniques)}
+    return uniques, np.fromiter((lookup[label] for label in labels), dtype=np.intp, count=len(labels))
+
+
+def _group_sum(labels, values):
+    uniques, idx = _encode(labels)
+    sums = np.bincount(idx, weights=values, minlength=len(uniques))
+    return dict(zip(uniques, sums.tolist()))
+
+
+def value_portfolio(portfolio, market_data, fx_rates):
+    """Values every priced holding in ``portfolio`` at once.
+
+    ``fx_rates`` maps currency code to its CNY rate. Holdings without market data
+    are skipped, matching the per-row behaviour of the report table.
+    """
+    codes = [c for c, d in portfolio.items() if isinstance(d, dict) and c in market_data]
+    n = len(codes)
+    shares = np.fromiter((portfolio[c]['shares'] for c in codes), dtype=np.float64, count=n)
+    price = np.fromiter((market_data[c]['price'] for c in codes), dtype=np.float64, count=n)
+    pre_close = np.fromiter((market_data[c]['pre_close'] for c in codes), dtype=np.float64, count=n)
+    currencies = [currency_for_code(c) for c in codes]
+    currency_labels, currency_idx = _encode(currencies)
+    fx = np.array([fx_rates[c] for c in currency_labels], dtype=np.float64)[currency_idx]
+
+    market_value = price * shares * fx
+    pre_close_value = pre_close * shares * fx
+    pnl = market_value - pre_close_value
+    pnl_percent = np.divide(pnl * 100, pre_close_value, out=np.zeros(n), where=pre_close_value != 0)
+
+    total_assets = float(market_value.sum())
+    total_pnl = float(pnl.sum())
+    total_pre_close = float(pre_close_value.sum())
+    weight = market_value / total_assets if total_assets else np.zeros(n)
+    # 各持仓对组合今日收益率的贡献（百分点），总和等于组合涨跌幅
+    contribution = pnl * 100 / total_pre_close if total_pre_close else np.zeros(n)
+
+    return {
+        'codes': codes, 'currencies': currencies, 'shares': shares, 'price': price, 'pre_close': pre_close,
+        'market_value_cny': market_value, 'pre_close_value_cny': pre_close_value, 'pnl_cny': pnl,
+        'pnl_percent': pnl_percent, 'weight': weight, 'pnl_contribution': contribution,
+        'total_assets_cny': total_assets, 'total_pnl_cny': total_pnl,
+        'total_pnl_percent': total_pnl * 100 / total_pre_close if total_pre_close else 0,
+    }
+
+
+def exposures(portfolio, valuation):
+    """Per-currency, per-market and per-sector CNY exposure and weights."""
+    codes, market_value = valuation['codes'], valuation['market_value_cny']
+    total = valuation['total_assets_cny'] or 1.0
+    sectors = [portfolio[c].get('sector') or '未分类' for c in codes]
+    markets = [market_for_code(c) or '其他' for c in codes]
+    result = {}
+    for name, labels in (('currency', valuation['currencies']), ('market', markets), ('sector', sectors)):
+        sums = _group_sum(labels, market_value)
+        result[name] = {label: {'value_cny': v, 'weight': v / total} for label, v in sums.items()}
+    return result
+
+
+def rows(portfolio, valuation):
+    """Materialises the columnar valuation as the report's per-code row dicts."""
+    columns = zip(valuation['codes'], valuation['currencies'], valuation['price'].tolist(),
+                  valuation['pre_close'].tolist(), valuation['market_value_cny'].tolist(),
+                  valuation['pnl_cny'].tolist(), valuation['pnl_percent'].tolist(),
+                  valuation['weight'].tolist(), valuation['pnl_contribution'].tolist())
+    return {
+        code: {
+            'price': price, 'pre_close': pre_close, 'name': portfolio[code]['name'],
+            'shares': portfolio[code]['shares'], 'currency': currency, 'market_value_cny': value,
+            'pnl_cny': pnl, 'pnl_percent': pnl_percent, 'weight': weight, 'pnl_contribution': contribution,
+        }
+        for code, currency, price, pre_close, value, pnl, pnl_percent, weight, contribution in columns
+    }
+
+
+def risk_metrics(values, resolution='1d'):
+    """Volatility of period returns and maximum drawdown of a value series.
+
+    Volatility is annualised for the 1d/1w/1m resolutions and per-period for raw
+    data. Non-positive values are dropped since returns are undefined for them.
+    """
+    v = np.asarray(values, dtype=np.float64)
+    v = v[v > 0]
+    if v.size < 2:
+        return {'volatility': None, 'max_drawdown': None, 'observations': int(v.size)}
+    returns = np.diff(v) / v[:-1]
+    volatility = float(returns.std(ddof=1)) if returns.size > 1 else 0.0
+    if resolution in PERIODS_PER_YEAR:
+        volatility *= float(np.sqrt(PERIODS_PER_YEAR[resolution]))
+    peak = np.maximum.accumulate(v)
+    return {'volatility': volatility, 'max_drawdown': float(((v - peak) / peak).min()), 'observations': int(v.size)}
+
+
+def return_risk_metrics(returns_percent, periods_per_year=PERIODS_PER_YEAR['1d']):
+    """Annualised volatility and maximum drawdown from per-period returns in percent.
+
+    The returns are compounded into a NAV index first, so deposits, withdrawals
+    and holding edits (which move total assets but not returns) never show up
+    as gains or drawdowns.
+    """
+    r = np.asarray(returns_percent, dtype=np.float64) / 100
+    if r.size < 1:
+        return {'volatility': None, 'max_drawdown': None, 'observations': 0}
+    nav = np.concatenate(([1.0], np.cumprod(1 + r)))
+    volatility = float(r.std(ddof=1)) * float(np.sqrt(periods_per_year)) if r.size > 1 else 0.0
+    peak = np.maximum.accumulate(nav)
+    return {'volatility': volatility, 'max_drawdown': float(((nav - peak) / peak).min()), 'observations': int(r.size)}
@@ -0,0 +1,66 @@
+"""Cold-start benchmark for the serverless function.
+
+Usage: python benchmarks/bench_cold_start.py [repeat]
+
+Every sample runs in a fresh interpreter, like a new function instance: it
+imports api/index.py, then sends one request through the Flask test client and
+reads the first chunk of the body. Reports import time, time-to-first-byte
+and which heavy dependencies the request ended up loading.
+
+Uses the Redis at KV_REDIS_URL; run it with Redis configured, otherwise the
+Redis round trips a route makes (and whether it imports the client at all)
+do not show up. The report page is requested once beforehand so ``/``
+measures the cached-snapshot fast path. Routes that scrape (news) hit the real
+upstream sites unless PROVIDER_REPLAY_DIR points at captured responses.
+"""
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(HERE, '..', 'api')
+HEAVY_MODULES = ('redis', 'requests', 'numpy', 'bs4')
+
+ROUTES = ['/', '/static/report.css', '/api/history?resolution=1d', '/api/news/002594.SZ']
+
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import index
+imported = time.perf_counter()
+route = sys.argv[2]
+if route.startswith('/static/'):
+    route = index.assets.url(route[len('/static/'):])
+response = index.app.test_client().get(route, buffered=False)
+next(iter(response.response), b'')
+first_byte = time.perf_counter()
+print(json.dumps({
+    'status': response.status_code,
+    'import_ms': (imported - started) * 1000,
+    'ttfb_ms': (first_byte - imported) * 1000,
+    'loaded': [m for m in sys.argv[3].split(',') if m in sys.modules],
+}))
+'''
+
+
+def sample(route):
+    out = subprocess.run([sys.executable, '-c', CHILD, API_DIR, route, ','.join(HEAVY_MODULES)],
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(repeat=5):
+    if not os.environ.get('KV_REDIS_URL'):
+        print("KV_REDIS_URL 未设置：依赖 Redis 的路由将返回 500")
+    sample('/')  # 预热快照，使 / 走快照快路径
+    print(f"{'route':<30} {'status':>6} {'import_ms':>10} {'ttfb_ms':>9}  loaded")
+    for route in ROUTES:
+        runs = [sample(route) for _ in range(repeat)]
+        best = min(runs, key=lambda run: run['import_ms'] + run['ttfb_ms'])
+        print(f"{route:<30} {best['status']:>6} {best['import_ms']:>10.1f} {best['ttfb_ms']:>9.1f}  {','.join(best['loaded']) or '-'}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
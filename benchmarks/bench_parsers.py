@@ -0,0 +1,54 @@
+"""HTML extraction backend micro-benchmark.
+
+Usage: python benchmarks/bench_parsers.py [repeat]
+
+Runs every available backend in api/parsers.py over the fixture pages in
+benchmarks/fixtures/ (synthetic pages that mirror the structure and size of
+the Sina news list and Google Finance quote pages) and checks that all
+backends agree with the bs4 reference output.
+"""
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'api'))
+import parsers  # noqa: E402
+
+FIXTURES = os.path.join(HERE, 'fixtures')
+
+
+def load(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main(repeat=20):
+    news_html = load('sina_news_002594.html')
+    fx_html = load('google_fx_hkd_cny.html')
+    reference_news = list(parsers.iter_news(news_html, backend='bs4'))
+    reference_fx = parsers.parse_fx_rate(fx_html, backend='bs4')
+
+    print(f"news page {len(news_html) // 1024} KiB ({len(reference_news)} items), fx page {len(fx_html) // 1024} KiB")
+    print(f"{'backend':>12} {'news_all_ms':>12} {'news_first5_ms':>15} {'fx_ms':>8} {'agrees':>7}")
+    for backend in parsers.BACKENDS:
+        news = list(parsers.iter_news(news_html, backend=backend))
+        fx = parsers.parse_fx_rate(fx_html, backend=backend)
+        agrees = news == reference_news and fx == reference_fx
+        all_ms = best_of(lambda: list(parsers.iter_news(news_html, backend=backend)), repeat)
+        first5_ms = best_of(lambda: [item for _, item in zip(range(5), parsers.iter_news(news_html, backend=backend))], repeat)
+        fx_ms = best_of(lambda: parsers.parse_fx_rate(fx_html, backend=backend), repeat)
+        print(f"{backend:>12} {all_ms:>12.2f} {first5_ms:>15.2f} {fx_ms:>8.2f} {str(agrees):>7}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
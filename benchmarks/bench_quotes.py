@@ -0,0 +1,89 @@
+"""Sina quote parsing scaling benchmark.
+
+Usage: python benchmarks/bench_quotes.py [n_symbols ...]
+
+Builds synthetic hq.sinajs.cn responses for n symbols (half A-share, half HK)
+and compares the old per-symbol regex scan with the single-pass tokenizer,
+then runs SinaQuoteProvider.fetch_quotes end to end (URL batching, parsing and
+timestamp decoding) against an in-memory transport. The per-symbol cost of the
+single-pass path should stay flat as n grows.
+"""
+from datetime import datetime, timedelta, timezone
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from providers import SinaQuoteProvider, CapturedResponse, parse_sina_quotes, parse_quote_time, sina_symbol  # noqa: E402
+
+NOW = datetime.now(timezone(timedelta(hours=8)))
+
+
+def make_codes(n):
+    return [f"{i:05d}.HK" if i % 2 else f"{600000 + i}.{'SH' if i % 4 else 'SZ'}" for i in range(n)]
+
+
+def quote_line(symbol):
+    if symbol.startswith('hk'):
+        fields = ['EN', '中文', '10.0', '9.8', '10.2', '9.7', '10.1'] + ['0'] * 10 + [f"{NOW:%Y/%m/%d}", f"{NOW:%H:%M}"]
+    else:
+        fields = ['名字', '10.0', '9.8', '10.1'] + ['0'] * 26 + [f"{NOW:%Y-%m-%d}", f"{NOW:%H:%M:%S}", '00']
+    return f'var hq_str_{symbol}="{",".join(fields)}";'
+
+
+class SyntheticTransport:
+    """Answers any quote URL with one line per requested symbol; bodies are built once per URL."""
+
+    def __init__(self):
+        self.bodies = {}
+
+    def get(self, url, **kwargs):
+        if url not in self.bodies:
+            symbols = url.split('list=')[1].split(',')
+            self.bodies[url] = '\n'.join(map(quote_line, symbols)).encode('gbk')
+        return CapturedResponse(url, 200, {}, self.bodies[url], 'gbk')
+
+
+def per_symbol_regex(content, symbols):
+    """The previous approach: one fresh pattern and full-body scan per symbol."""
+    found = {}
+    for symbol in symbols:
+        match = re.search(f'var hq_str_{symbol}="(.*?)"', content)
+        if match:
+            found[symbol] = match.group(1).split(',')
+    return found
+
+
+def best_of(fn, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main(sizes):
+    print(f"{'symbols':>8} {'batches':>8} {'regex_ms':>10} {'single_ms':>10} {'fetch_ms':>10} {'us/symbol':>10}")
+    for n in sizes:
+        codes = make_codes(n)
+        symbols = [sina_symbol(c) for c in codes]
+        content = '\n'.join(map(quote_line, symbols))
+        assert parse_sina_quotes(content) == per_symbol_regex(content, symbols)
+
+        regex_ms = best_of(lambda: per_symbol_regex(content, symbols))
+        single_ms = best_of(lambda: parse_sina_quotes(content))
+        provider = SinaQuoteProvider(SyntheticTransport())
+
+        def fetch():
+            parse_quote_time.cache_clear()
+            assert len(provider.fetch_quotes(codes)) == n
+        fetch()  # build the synthetic bodies outside the timed runs
+        fetch_ms = best_of(fetch)
+        batches = len(list(provider.batches(symbols)))
+        print(f"{n:>8} {batches:>8} {regex_ms:>10.2f} {single_ms:>10.2f} {fetch_ms:>10.2f} {fetch_ms * 1000 / n:>10.2f}")
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [100, 500, 1000, 2000, 5000])
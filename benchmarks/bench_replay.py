@@ -0,0 +1,103 @@
+"""Offline data-pipeline benchmark on the replay transport.
+
+Usage: python benchmarks/bench_replay.py [capture_dir]
+
+Serves every upstream call from captured responses instead of the network and
+times the default portfolio's quote, FX and news fetches (including parsing),
+then valuation and rendering, at several simulated upstream latencies.
+
+Without ``capture_dir`` a synthetic capture set is built from
+benchmarks/fixtures/. To capture real responses, run the app once with
+PROVIDER_RECORD_DIR=<dir> and pass that directory here. Runs without Redis,
+so every iteration does the full fetch.
+"""
+from datetime import datetime, timedelta, timezone
+from functools import partial
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, 'fixtures')
+LATENCIES_MS = [0, 50, 200]
+
+
+def synthetic_captures(directory, portfolio):
+    from providers import SinaQuoteProvider, SinaNewsProvider, GoogleFxProvider, sina_symbol, write_capture
+    now = datetime.now(timezone(timedelta(hours=8)))
+    a_codes = sorted(c for c in portfolio if not c.endswith('.HK'))
+    hk_codes = sorted(c for c in portfolio if c.endswith('.HK'))
+
+    a_lines = [f'var hq_str_{sina_symbol(c)}="{c},10.0,9.8,10.1{",0" * 26},{now:%Y-%m-%d},{now:%H:%M:%S},00";'
+               for c in a_codes]
+    hk_lines = [f'var hq_str_{sina_symbol(c)}="EN,{c},10.0,9.8,10.2,9.7,10.1{",0" * 10},{now:%Y/%m/%d},{now:%H:%M}";'
+                for c in hk_codes]
+    for codes, lines in ((a_codes, a_lines), (hk_codes, hk_lines)):
+        url = SinaQuoteProvider.URL.format(','.join(sina_symbol(c) for c in codes))
+        write_capture(directory, url, 200, {}, '\n'.join(lines).encode('gbk'), 'gbk')
+
+    with open(os.path.join(FIXTURES, 'google_fx_hkd_cny.html'), 'rb') as f:
+        write_capture(directory, GoogleFxProvider.URL.format('HKD', 'CNY'), 200, {}, f.read(), 'utf-8')
+    with open(os.path.join(FIXTURES, 'sina_news_002594.html'), encoding='utf-8') as f:
+        news = f.read().encode('gbk', errors='replace')
+    for code in portfolio:
+        write_capture(directory, SinaNewsProvider.URL.format(sina_symbol(code)), 200, {}, news, 'gbk')
+
+
+def best_of(fn, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main(capture_dir=None):
+    os.environ.pop('KV_REDIS_URL', None)
+    os.environ['PROVIDER_REPLAY_DIR'] = capture_dir or tempfile.mkdtemp(prefix='captures-')
+    sys.path.insert(0, os.path.join(HERE, '..', 'api'))
+    import index  # noqa: E402
+    if capture_dir is None:
+        synthetic_captures(index.PROVIDER_REPLAY_DIR, index.DEFAULT_PORTFOLIO)
+
+    portfolio = index.DEFAULT_PORTFOLIO
+    a_codes, hk_codes = index.split_codes(portfolio)
+
+    def quotes():
+        results = index.run_concurrently({'A': partial(index.get_quotes, a_codes),
+                                          'HK': partial(index.get_quotes, hk_codes, is_hk=True)},
+                                         timeout=index.FETCH_DEADLINE_SECONDS)
+        return {**(results['A'] or {}), **(results['HK'] or {})}
+
+    news_jobs = {code: partial(lambda c: list(index.news_provider.fetch_news(c)[0]), code) for code in portfolio}
+    stages = {
+        'quotes': quotes,
+        'fx': partial(index.fx_provider.fetch_rate, 'HKD', 'CNY'),
+        'news': partial(index.run_concurrently, news_jobs, timeout=index.FETCH_DEADLINE_SECONDS),
+    }
+    market_data, rate = quotes(), index.fx_provider.fetch_rate('HKD', 'CNY')
+
+    def value_and_render():
+        from valuation import value_portfolio, rows
+        valuation = value_portfolio(portfolio, market_data, {'CNY': 1.0, 'HKD': rate})
+        return index.render_main_content_html({
+            'portfolio': portfolio, 'liabilities': 0, 'all_data': rows(portfolio, valuation), 'news_data': {},
+            'total_assets_cny': valuation['total_assets_cny'], 'net_worth': valuation['total_assets_cny'],
+            'total_pnl_cny': valuation['total_pnl_cny'], 'total_pnl_percent': valuation['total_pnl_percent'],
+        })
+
+    print(f"captures: {index.PROVIDER_REPLAY_DIR}, {len(portfolio)} holdings, {len(market_data)} quoted")
+    print(f"{'latency_ms':>10} {'quotes_ms':>10} {'fx_ms':>8} {'news_ms':>9} {'render_ms':>10} {'parallel_ms':>12}")
+    for latency_ms in LATENCIES_MS:
+        index.transport.latency = latency_ms / 1000
+        timings = {name: best_of(fn) for name, fn in stages.items()}
+        parallel = best_of(lambda: index.run_concurrently(stages, timeout=index.FETCH_DEADLINE_SECONDS))
+        render = best_of(value_and_render)
+        print(f"{latency_ms:>10} {timings['quotes']:>10.1f} {timings['fx']:>8.1f} {timings['news']:>9.1f} "
+              f"{render:>10.1f} {parallel + render:>12.1f}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
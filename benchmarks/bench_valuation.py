@@ -0,0 +1,58 @@
+"""Valuation engine scaling benchmark.
+
+Usage: python benchmarks/bench_valuation.py [n_positions ...]
+
+Times the columnar valuation, exposure grouping and row materialisation for
+synthetic portfolios, plus risk metrics over five years of daily history.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from valuation import value_portfolio, exposures, rows, risk_metrics  # noqa: E402
+
+SECTORS = ['汽车', '电力设备', '半导体', '地产', '机器人']
+
+
+def make_portfolio(n, seed=0):
+    rng = random.Random(seed)
+    portfolio, market_data = {}, {}
+    for i in range(n):
+        code = f"{i:05d}.HK" if i % 3 == 0 else f"{600000 + i}.{'SH' if i % 2 else 'SZ'}"
+        portfolio[code] = {'shares': rng.randint(100, 100000), 'name': f"股票{i}", 'sector': rng.choice(SECTORS)}
+        pre_close = rng.uniform(1, 500)
+        market_data[code] = {'price': pre_close * rng.uniform(0.9, 1.1), 'pre_close': pre_close}
+    return portfolio, market_data
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main(sizes):
+    fx = {'CNY': 1.0, 'HKD': 0.91}
+    print(f"{'positions':>10} {'value_ms':>10} {'exposure_ms':>12} {'rows_ms':>10} {'total_ms':>10}")
+    for n in sizes:
+        portfolio, market_data = make_portfolio(n)
+        valuation = value_portfolio(portfolio, market_data, fx)
+        value_ms = best_of(lambda: value_portfolio(portfolio, market_data, fx))
+        exposure_ms = best_of(lambda: exposures(portfolio, valuation))
+        rows_ms = best_of(lambda: rows(portfolio, valuation))
+        print(f"{n:>10} {value_ms:>10.2f} {exposure_ms:>12.2f} {rows_ms:>10.2f} {value_ms + exposure_ms + rows_ms:>10.2f}")
+
+    rng = random.Random(1)
+    series = [1e6]
+    for _ in range(5 * 252):
+        series.append(series[-1] * (1 + rng.gauss(0, 0.015)))
+    print(f"risk_metrics over {len(series)} daily points: {best_of(lambda: risk_metrics(series)):.2f} ms")
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [10, 100, 1000, 10000, 50000])